@@ -1,163 +1,1992 @@
 import flet as ft
+from collections import OrderedDict
 from datetime import datetime, timedelta
+from functools import cached_property
+import atexit
+import bisect
+import calendar
+import hashlib
+import heapq
+import itertools
 import json
+import math
 import os
+import pickle
+import sqlite3
+import sys
+import tempfile
+import threading
 from typing import Dict, List, Optional
 
-class FinanceApp:
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+try:
+    import joblib
+    from sklearn.linear_model import Ridge
+except ImportError:
+    joblib = None
+    Ridge = None
+
+# После стольких записей журнал сворачивается в полный снимок finance_data.json
+JOURNAL_COMPACT_THRESHOLD = 500
+
+# Сколько предыдущих целых снимков хранить рядом с finance_data.json (.1 ... .N);
+# столько же свернутых частей журнала лежит в finance_data.journal.1 ... .N
+SNAPSHOT_KEEP = 3
+
+# Окно (в секундах), в котором серия правок из полей ввода сливается в одну запись
+SAVE_DELAY = 1.0
+
+# Хранилище данных: "json" (finance_data.json + журнал) или "sqlite" (finance_data.db)
+STORAGE_BACKEND = os.environ.get("FINANCE_STORAGE", "json")
+
+def month_range(year, month):
+    """Границы месяца [начало, начало следующего) в формате дат транзакций"""
+    start = f"{year:04d}-{month:02d}-01"
+    if month == 12:
+        return start, f"{year + 1:04d}-01-01"
+    return start, f"{year:04d}-{month + 1:02d}-01"
+
+class SqliteStorage:
+    """Хранилище в SQLite: транзакции, цели, дни рождения и заметки в отдельных таблицах"""
+    
+    # Ключи данных, которые хранятся в собственных таблицах, а не в settings
+    LIST_TABLES = {"goals": "goals", "birthdays": "birthdays", "notes": "notes"}
+    
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self._lock = threading.RLock()
+        # Запись идет из фонового потока отложенного сохранения, поэтому соединение общее под блокировкой
+        self.connection = sqlite3.connect(db_file, check_same_thread=False)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS transactions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                date TEXT NOT NULL,
+                type TEXT NOT NULL,
+                category TEXT,
+                amount REAL NOT NULL,
+                doc TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_transactions_date_type_category
+                ON transactions (date, type, category);
+            CREATE TABLE IF NOT EXISTS goals (position INTEGER PRIMARY KEY, name TEXT, doc TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS birthdays (position INTEGER PRIMARY KEY, name TEXT, doc TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS notes (position INTEGER PRIMARY KEY, note_id INTEGER, doc TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+        """)
+    
+    def is_empty(self):
+        with self._lock:
+            return self.connection.execute("SELECT COUNT(*) FROM settings").fetchone()[0] == 0
+    
+    def load(self):
+        """Собирает словарь данных в том же виде, что и finance_data.json"""
+        with self._lock:
+            data = {}
+            for key, value in self.connection.execute("SELECT key, value FROM settings"):
+                data[key] = json.loads(value)
+            data["transactions"] = [
+                json.loads(doc) for (doc,) in self.connection.execute("SELECT doc FROM transactions ORDER BY id")
+            ]
+            for key, table in self.LIST_TABLES.items():
+                if key not in data:
+                    continue
+                data[key] = [
+                    json.loads(doc) for (doc,) in self.connection.execute(f"SELECT doc FROM {table} ORDER BY position")
+                ]
+            return data
+    
+    def replace_all(self, data):
+        """Полностью перезаписывает содержимое базы (импорт из JSON)"""
+        with self._lock, self.connection:
+            self.connection.execute("DELETE FROM transactions")
+            self.connection.execute("DELETE FROM settings")
+            for table in self.LIST_TABLES.values():
+                self.connection.execute(f"DELETE FROM {table}")
+            self._insert_transactions(data["transactions"])
+            for key, value in data.items():
+                if key != "transactions":
+                    self._write_key(key, value)
+    
+    def apply_changes(self, appended, changed, deleted):
+        """Применяет новые транзакции и измененные ключи одной транзакцией SQLite"""
+        with self._lock, self.connection:
+            self._insert_transactions(appended)
+            for key, value in changed.items():
+                self._write_key(key, value)
+            for key in deleted:
+                if key in self.LIST_TABLES:
+                    self.connection.execute(f"DELETE FROM {self.LIST_TABLES[key]}")
+                self.connection.execute("DELETE FROM settings WHERE key = ?", (key,))
+    
+    def category_totals(self, transaction_type, start, end):
+        """Суммы по категориям за период [start, end) - диапазонный запрос по индексу"""
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT category, SUM(amount) FROM transactions "
+                "WHERE date >= ? AND date < ? AND type = ? GROUP BY category",
+                (start, end, transaction_type)
+            )
+            return {category: total for category, total in rows}
+    
+    def _insert_transactions(self, transactions):
+        self.connection.executemany(
+            "INSERT INTO transactions (date, type, category, amount, doc) VALUES (?, ?, ?, ?, ?)",
+            [
+                (t["date"], t["type"], t.get("category", "Прочее"), t["amount"], json.dumps(t, ensure_ascii=False))
+                for t in transactions
+            ]
+        )
+    
+    def _write_key(self, key, value):
+        if key in self.LIST_TABLES:
+            table = self.LIST_TABLES[key]
+            self.connection.execute(f"DELETE FROM {table}")
+            if table == "notes":
+                rows = [(i, item.get("id"), json.dumps(item, ensure_ascii=False)) for i, item in enumerate(value)]
+            else:
+                rows = [(i, item.get("name"), json.dumps(item, ensure_ascii=False)) for i, item in enumerate(value)]
+            self.connection.executemany(f"INSERT INTO {table} VALUES (?, ?, ?)", rows)
+            # Отметка в settings, чтобы при загрузке отличать пустой список от отсутствующего ключа
+            value = None
+        self.connection.execute(
+            "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+            (key, json.dumps(value, ensure_ascii=False))
+        )
+
+def parse_transaction_date(date_str):
+    """Разбирает дату транзакции ("YYYY-MM-DD HH:MM" или "YYYY-MM-DD"); None, если формат неверный"""
+    try:
+        if len(date_str) <= 10:
+            return datetime.strptime(date_str, "%Y-%m-%d")
+        return datetime.strptime(date_str, "%Y-%m-%d %H:%M")
+    except (TypeError, ValueError):
+        return None
+
+def transaction_timestamp(date_str):
+    """Переводит дату транзакции в секунды эпохи (время считается UTC, без часового пояса)"""
+    date = parse_transaction_date(date_str)
+    if date is None:
+        return None
+    return calendar.timegm(date.timetuple())
+
+# Суммы в Transaction хранятся целым числом копеек
+KOPECKS = 100
+
+# Transaction.weekday -> название дня (не зависит от локали, в отличие от strftime("%A"))
+WEEKDAY_NAMES = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+
+class Transaction:
+    """Транзакция с заранее разобранной датой: строится один раз при загрузке"""
+    
+    __slots__ = ("timestamp", "month_key", "year", "month", "weekday", "type", "category", "amount", "source", "flag")
+    
+    def __init__(self, source):
+        self.source = source
+        # Отметка AnomalyDetector: None, "impulse", "gift" или "outlier"
+        self.flag = None
+        self.type = sys.intern(source["type"])
+        category = source.get("category", "Прочее")
+        self.category = sys.intern(category) if isinstance(category, str) else category
+        self.amount = round(source["amount"] * KOPECKS)
+        
+        date = parse_transaction_date(source["date"])
+        if date is None:
+            # Нераспознанная дата: транзакция не попадает ни в один период
+            self.timestamp = None
+            self.month_key = None
+            self.year = None
+            self.month = None
+            self.weekday = None
+        else:
+            self.timestamp = calendar.timegm(date.timetuple())
+            self.month_key = sys.intern(source["date"][:7])
+            self.year = date.year
+            self.month = date.month
+            self.weekday = date.weekday()
+    
+    @classmethod
+    def restore(cls, source, transaction_type, category, amount, timestamp, month_key, year, month, weekday):
+        """Транзакция с уже разобранной датой (из колоночной копии) - без strptime"""
+        t = cls.__new__(cls)
+        t.source = source
+        t.flag = None
+        t.type = transaction_type
+        t.category = category
+        t.amount = amount
+        t.timestamp = timestamp
+        t.month_key = month_key
+        t.year = year
+        t.month = month
+        t.weekday = weekday
+        return t
+
+def ledger_sum(transactions):
+    """Сумма в рублях по набору Transaction"""
+    return sum(t.amount for t in transactions) / KOPECKS
+
+def month_key(year, month):
+    """Ключ месяца в формате YYYY-MM, как в Transaction.month_key"""
+    return f"{year:04d}-{month:02d}"
+
+def recent_months(count, today=None):
+    """Последние count месяцев, включая текущий, от старых к новым: [(год, месяц), ...]"""
+    today = today or datetime.now()
+    index = today.year * 12 + today.month - 1
+    return [(i // 12, i % 12 + 1) for i in range(index - count + 1, index + 1)]
+
+# Пауза после последнего нажатия клавиши (в секундах), после которой запускается анализ покупки
+PURCHASE_ANALYSIS_DELAY = 0.3
+
+# Сколько последних анализов покупки (по названию и цене) держать в кэше
+PURCHASE_ANALYSIS_CACHE_SIZE = 32
+
+# Знак влияния транзакции на баланс (current_money)
+BALANCE_SIGNS = {"income": 1, "expense": -1, "goal_investment": -1}
+
+class DateIndex:
+    """Транзакции, упорядоченные по дате, с поиском диапазона за O(log n).
+    
+    Вместе с порядком хранятся префиксные суммы движения денег: prefix[i] -
+    изменение баланса от первых i транзакций (в копейках).
+    """
+    
+    def __init__(self, transactions=()):
+        # sorted устойчива: транзакции с одинаковым временем остаются в порядке добавления
+        self.transactions = sorted((t for t in transactions if t.timestamp is not None), key=lambda t: t.timestamp)
+        self.timestamps = [t.timestamp for t in self.transactions]
+        self.prefix = [0]
+        for t in self.transactions:
+            self.prefix.append(self.prefix[-1] + BALANCE_SIGNS.get(t.type, 0) * t.amount)
+    
+    @classmethod
+    def from_sorted(cls, transactions, timestamps, prefix):
+        """Индекс по готовому порядку и префиксным суммам (из колоночной копии)"""
+        index = cls()
+        index.transactions = transactions
+        index.timestamps = timestamps
+        index.prefix = prefix
+        return index
+    
+    def __len__(self):
+        return len(self.transactions)
+    
+    def add(self, t):
+        if t.timestamp is None:
+            return
+        flow = BALANCE_SIGNS.get(t.type, 0) * t.amount
+        if not self.timestamps or t.timestamp >= self.timestamps[-1]:
+            self.timestamps.append(t.timestamp)
+            self.transactions.append(t)
+            self.prefix.append(self.prefix[-1] + flow)
+        else:
+            # Транзакция задним числом (например, из импорта): сдвигаем хвост префиксных сумм
+            position = bisect.bisect_right(self.timestamps, t.timestamp)
+            self.timestamps.insert(position, t.timestamp)
+            self.transactions.insert(position, t)
+            self.prefix.insert(position + 1, self.prefix[position] + flow)
+            for i in range(position + 2, len(self.prefix)):
+                self.prefix[i] += flow
+    
+    def extend(self, transactions):
+        """Добавляет пачку транзакций; если в ней много записей задним числом, индекс строится заново"""
+        dated = [t for t in transactions if t.timestamp is not None]
+        latest = self.timestamps[-1] if self.timestamps else None
+        backdated = 0
+        for t in dated:
+            if latest is not None and t.timestamp < latest:
+                backdated += 1
+            else:
+                latest = t.timestamp
+        if backdated <= 16:
+            for t in dated:
+                self.add(t)
+        else:
+            self.__init__(self.transactions + dated)
+    
+    def flow_before(self, timestamp):
+        """Изменение баланса (копейки) от всех транзакций раньше timestamp"""
+        return self.prefix[bisect.bisect_left(self.timestamps, timestamp)]
+    
+    def total_flow(self):
+        return self.prefix[-1]
+    
+    def between(self, start_timestamp, end_timestamp):
+        """Транзакции с временем в [start_timestamp, end_timestamp) в порядке дат"""
+        low = bisect.bisect_left(self.timestamps, start_timestamp)
+        high = bisect.bisect_left(self.timestamps, end_timestamp)
+        return self.transactions[low:high]
+    
+    def latest(self, count):
+        """Последние по дате count транзакций, от старых к новым"""
+        return self.transactions[-count:] if count > 0 else []
+
+# Сколько транзакций показывает одна страница истории
+HISTORY_PAGE_SIZE = 50
+
+class TransactionHistory:
+    """Постраничная история транзакций от новых к старым с фильтрами по типу, категории и датам.
+    
+    Страница собирается проходом по DateIndex назад от запомненной позиции, поэтому в памяти
+    держится только текущая страница и позиции начала уже открытых страниц, а не весь отбор.
+    """
+    
+    def __init__(self, finance_app, page_size=HISTORY_PAGE_SIZE):
+        self.finance_app = finance_app
+        self.page_size = page_size
+        self.transaction_type = None
+        self.category = None
+        # Границы периода включительно, YYYY-MM-DD
+        self.start = None
+        self.end = None
+        self.reset()
+    
+    def reset(self):
+        self.page_number = 0
+        # starts[i] - позиция в DateIndex, с которой (не включая ее) идет назад страница i
+        self.starts = None
+        self.version = None
+    
+    def set_filter(self, **filters):
+        for name, value in filters.items():
+            setattr(self, name, value or None)
+        self.reset()
+    
+    def matches(self, t):
+        if self.transaction_type is not None and t.type != self.transaction_type:
+            return False
+        return self.category is None or t.category == self.category
+    
+    def bounds(self, index):
+        low = 0
+        high = len(index)
+        start = transaction_timestamp(self.start) if self.start else None
+        end = transaction_timestamp(self.end) if self.end else None
+        if start is not None:
+            low = bisect.bisect_left(index.timestamps, start)
+        if end is not None:
+            # Конец периода включительно - до начала следующего дня
+            high = bisect.bisect_left(index.timestamps, end + 86400)
+        return low, max(low, high)
+    
+    def positions(self, index, low, position):
+        """Позиции подходящих транзакций от position - 1 назад до low"""
+        for i in range(position - 1, low - 1, -1):
+            if self.matches(index.transactions[i]):
+                yield i
+    
+    def page(self):
+        """Транзакции текущей страницы (от новых к старым) и есть ли следующая страница"""
+        with self.finance_app.lock:
+            return self._page()
+    
+    def _page(self):
+        self.finance_app.get_ledger()
+        index = self.finance_app.date_index
+        low, high = self.bounds(index)
+        
+        # Позиции сдвигаются только при изменении транзакций (новый индекс или другая длина) -
+        # тогда начинаем с первой страницы; правки остальных полей страницу не сбрасывают
+        version = (len(index), low, high)
+        if self.version is None or self.version[0] is not index or self.version[1:] != version:
+            self.page_number = 0
+            self.starts = [high]
+            self.version = (index,) + version
+        
+        found = self.positions(index, low, self.starts[self.page_number])
+        positions = list(itertools.islice(found, self.page_size))
+        has_next = next(found, None) is not None
+        if has_next and len(self.starts) == self.page_number + 1:
+            self.starts.append(positions[-1])
+        return [index.transactions[i] for i in positions], has_next
+    
+    def next_page(self):
+        """Переход вперед возможен только после показа текущей страницы (когда известно ее окончание)"""
+        if self.page_number + 1 < len(self.starts or ()):
+            self.page_number += 1
+    
+    def previous_page(self):
+        if self.page_number > 0:
+            self.page_number -= 1
+
+class AggregateIndex:
+    """Суммы транзакций по ключу (YYYY-MM, тип, категория), обновляемые за O(1) на транзакцию"""
+    
+    def __init__(self, transactions=()):
+        # (YYYY-MM, тип) -> {категория: копейки} и (YYYY-MM, тип) -> копейки
+        self.categories = {}
+        self.totals = {}
+        # YYYY-MM -> число записей в этот месяц (меняется и при записи задним числом)
+        self.month_versions = {}
+        for t in transactions:
+            self.add(t)
+    
+    @classmethod
+    def from_sums(cls, categories, month_versions):
+        """Индекс по готовым суммам {(YYYY-MM, тип): {категория: копейки}} (из колоночной копии)"""
+        index = cls()
+        index.categories = categories
+        index.totals = {key: sum(amounts.values()) for key, amounts in categories.items()}
+        index.month_versions = month_versions
+        return index
+    
+    def add(self, t):
+        if t.month_key is None:
+            return
+        self.month_versions[t.month_key] = self.month_versions.get(t.month_key, 0) + 1
+        key = (t.month_key, t.type)
+        categories = self.categories.setdefault(key, {})
+        categories[t.category] = categories.get(t.category, 0) + t.amount
+        self.totals[key] = self.totals.get(key, 0) + t.amount
+    
+    def total(self, month, transaction_type):
+        """Сумма в рублях за месяц (YYYY-MM) по типу транзакций"""
+        return self.totals.get((month, transaction_type), 0) / KOPECKS
+    
+    def category_totals(self, month, transaction_type):
+        """Суммы в рублях по категориям за месяц (YYYY-MM)"""
+        # list() копирует пары за один шаг: индекс может пополняться из другого потока
+        categories = list(self.categories.get((month, transaction_type), {}).items())
+        return {category: amount / KOPECKS for category, amount in categories}
+
+# Сколько закрытых месяцев нужно, чтобы доверять измеренной сезонности
+SEASONALITY_MIN_MONTHS = 12
+
+class SeasonalModel:
+    """Сезонные индексы расходов по категориям: 12 слотов по месяцам года.
+    
+    Индекс слота - средние расходы в этом месяце года, деленные на средние по всем
+    месяцам (1.0 - обычный месяц, 1.5 - на 50% дороже). Учитываются только закрытые
+    месяцы; каждый новый закрытый месяц добавляется к суммам без пересчета истории.
+    """
+    
     def __init__(self):
+        # категория -> [12 сумм в копейках]; counts - сколько раз учтен каждый месяц года
+        self.sums = {}
+        self.counts = [0] * 12
+        # Закрытый месяц -> число записей в нем: запись задним числом сбрасывает модель
+        self.month_counts = {}
+        self.through = None
+    
+    @classmethod
+    def load(cls, path):
+        model = cls()
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            model.sums = {category: sums for category, sums in state["sums"]}
+            model.counts = state["counts"]
+            model.month_counts = state["month_counts"]
+            model.through = state["through"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return cls()
+        return model
+    
+    def save(self, path):
+        fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            # Категория может быть null, поэтому суммы хранятся списком пар
+            json.dump({
+                "sums": list(self.sums.items()),
+                "counts": self.counts,
+                "month_counts": self.month_counts,
+                "through": self.through
+            }, f, ensure_ascii=False)
+        os.replace(tmp_file, path)
+    
+    def update(self, aggregates, current_month):
+        """Добавляет месяцы, закрывшиеся после through; возвращает True, если модель изменилась"""
+        versions = aggregates.month_versions
+        closed = [month for month in versions if month < current_month]
+        
+        stale = any(versions.get(month, 0) != count for month, count in self.month_counts.items())
+        if self.through is not None:
+            stale = stale or any(month <= self.through and month not in self.month_counts for month in closed)
+        if stale:
+            self.__init__()
+        if not closed:
+            return stale
+        
+        first = self.through or min(closed)
+        year, month = int(first[:4]), int(first[5:7])
+        if self.through is not None:
+            year, month = divmod(year * 12 + month, 12)
+            month += 1
+        
+        changed = stale
+        while month_key(year, month) < current_month:
+            self.add_month(aggregates, year, month)
+            changed = True
+            year, month = divmod(year * 12 + month, 12)
+            month += 1
+        return changed
+    
+    def add_month(self, aggregates, year, month):
+        key = month_key(year, month)
+        self.through = key
+        # Месяц без единой записи считаем неучтенным, а не месяцем без расходов
+        if not aggregates.month_versions.get(key):
+            return
+        self.month_counts[key] = aggregates.month_versions[key]
+        self.counts[month - 1] += 1
+        for category, amount in aggregates.categories.get((key, "expense"), {}).items():
+            self.sums.setdefault(category, [0] * 12)[month - 1] += amount
+    
+    @property
+    def months_observed(self):
+        return sum(self.counts)
+    
+    def monthly_averages(self, category=None):
+        """Средние расходы в рублях по месяцам года (None для месяцев без наблюдений)"""
+        if category is None:
+            slots = [sum(sums[i] for sums in self.sums.values()) for i in range(12)]
+        else:
+            slots = self.sums.get(category, [0] * 12)
+        return [slots[i] / self.counts[i] / KOPECKS if self.counts[i] else None for i in range(12)]
+    
+    def index(self, category=None):
+        """12 сезонных индексов категории (или всех расходов); 1.0 для месяцев без данных"""
+        averages = self.monthly_averages(category)
+        observed = [value for value in averages if value is not None]
+        overall = sum(observed) / len(observed) if observed else 0
+        if overall <= 0:
+            return [1.0] * 12
+        return [value / overall if value is not None else 1.0 for value in averages]
+    
+    def top_categories(self, month, count=2):
+        """Категории с самым сильным сезонным ростом в месяце года"""
+        peaks = []
+        for category in self.sums:
+            ratio = self.index(category)[month - 1]
+            if ratio > 1.05:
+                peaks.append((ratio, category))
+        peaks.sort(key=lambda peak: peak[0], reverse=True)
+        return [category for _, category in peaks[:count]]
+
+# Число траекторий и горизонт (месяцев) вероятностного прогноза баланса
+SIMULATION_PATHS = 10000
+SIMULATION_MONTHS = 24
+
+# Описание расхода, который записывает кнопка оплаты квартплаты
+RENT_PAYMENT_DESCRIPTION = "Оплата квартплаты"
+
+# Описания расходов, которые приложение записывает само за плановые платежи прогноза.
+# Совпадение только точное: подарки и подписки, введенные вручную, остаются обычными тратами
+SCHEDULED_EXPENSE_DESCRIPTIONS = (RENT_PAYMENT_DESCRIPTION,)
+
+def is_scheduled_expense(transaction):
+    """Расход из календаря плановых платежей - его нельзя повторно учитывать в обычных тратах"""
+    return transaction.get("description") in SCHEDULED_EXPENSE_DESCRIPTIONS
+
+def simulate_balance(start_balance, net_schedule, expense_history, reserve, paths=SIMULATION_PATHS, seed=None):
+    """Монте-Карло прогноз баланса по месяцам.
+    
+    net_schedule - известный заранее результат каждого месяца (доход минус квартплата,
+    подписки, праздники и дни рождения); обычные расходы месяца выбираются случайно
+    из истории закрытых месяцев без этих плановых платежей (бутстрэп). Все траектории считаются одной матрицей.
+    Возвращает перцентили баланса и вероятность опуститься ниже reserve или None без numpy/истории.
+    """
+    if np is None or len(expense_history) < 3 or not net_schedule:
+        return None
+    
+    rng = np.random.default_rng(seed)
+    history = np.asarray(expense_history, dtype=np.float64)
+    draws = history[rng.integers(0, len(history), size=(paths, len(net_schedule)))]
+    balances = start_balance + np.cumsum(np.asarray(net_schedule, dtype=np.float64) - draws, axis=1)
+    
+    low, median, high = np.percentile(balances, [10, 50, 90], axis=0)
+    below = balances < reserve
+    return {
+        "p10": low.tolist(),
+        "p50": median.tolist(),
+        "p90": high.tolist(),
+        "below_reserve": float(below.any(axis=1).mean()),
+        "below_reserve_by_month": below.mean(axis=0).tolist()
+    }
+
+# На сколько месяцев вперед строится план взносов в цели
+GOAL_HORIZON_MONTHS = 120
+
+def allocate_goal_savings(goals, monthly_budget, horizon=GOAL_HORIZON_MONTHS):
+    """План взносов в цели по месяцам при фиксированной сумме на цели в месяц.
+    
+    goals - [{"name", "remaining", "deadline"}], deadline - сколько месяцев до срока.
+    Набор целей, успевающих к сроку, выбирается алгоритмом Мура-Ходжсона (минимум
+    просроченных целей): цели идут по сроку, и если их сумма не помещается в бюджет
+    до срока очередной цели, из набора выбрасывается самая крупная. Затем бюджет
+    каждого месяца отдается успевающим целям по сроку, а после них - просроченным.
+    Возвращает копии целей в порядке финансирования, дополненные графиком взносов
+    (schedule), месяцем завершения, признаком on_time и недобором к сроку (shortfall).
+    """
+    order = sorted(range(len(goals)), key=lambda i: goals[i]["deadline"])
+    on_time = []
+    late = []
+    load = 0
+    for i in order:
+        heapq.heappush(on_time, (-goals[i]["remaining"], i))
+        load += goals[i]["remaining"]
+        if load > monthly_budget * goals[i]["deadline"]:
+            remaining, dropped = heapq.heappop(on_time)
+            load += remaining
+            late.append(dropped)
+    
+    funding = sorted((i for _, i in on_time), key=lambda i: goals[i]["deadline"])
+    funding += sorted(late, key=lambda i: goals[i]["deadline"])
+    
+    left = [goal["remaining"] for goal in goals]
+    schedules = [[0] * horizon for _ in goals]
+    completion = {}
+    position = 0
+    for month in range(horizon):
+        budget = monthly_budget
+        while budget > 0 and position < len(funding):
+            i = funding[position]
+            amount = min(budget, left[i])
+            schedules[i][month] += amount
+            left[i] -= amount
+            budget -= amount
+            if left[i] <= 0:
+                completion[i] = month
+                position += 1
+        if position == len(funding):
+            break
+    
+    plan = []
+    for i in funding:
+        deadline = goals[i]["deadline"]
+        plan.append(dict(
+            goals[i],
+            schedule=schedules[i],
+            completion_month=completion.get(i),
+            on_time=i in completion and completion[i] < deadline,
+            shortfall=max(0, goals[i]["remaining"] - sum(schedules[i][:deadline]))
+        ))
+    return plan
+
+# Сколько закрытых месяцев с записями нужно для обучения прогноза расходов
+FORECAST_MIN_MONTHS = 6
+
+class ExpenseForecaster:
+    """Прогноз расходов по категориям: линейная регрессия (scikit-learn) на помесячных суммах.
+    
+    Модели учатся только на обычных тратах: плановые платежи (оплату квартплаты)
+    прогноз баланса добавляет сам по календарю.
+    Признаки месяца - порядковый номер (тренд) и положение в году (сезонность).
+    Обученные модели сохраняются через joblib вместе с отпечатком закрытых месяцев;
+    переобучение происходит, только если отпечаток изменился.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.fingerprint = None
+        self.models = {}
+        self.first_month = None
+        self._predictions = {}
+    
+    @property
+    def available(self):
+        return Ridge is not None and np is not None
+    
+    @property
+    def trained(self):
+        return bool(self.models)
+    
+    @staticmethod
+    def closed_months(aggregates, current_month):
+        """Закрытые месяцы с расходами по порядку: [(YYYY-MM, число записей), ...]"""
+        return sorted(
+            (month, count) for month, count in aggregates.month_versions.items()
+            if month < current_month and aggregates.totals.get((month, "expense"))
+        )
+    
+    @staticmethod
+    def month_index(month):
+        return int(month[:4]) * 12 + int(month[5:7]) - 1
+    
+    def features(self, index):
+        angle = 2 * math.pi * (index % 12) / 12
+        return [index - self.first_month, math.sin(angle), math.cos(angle)]
+    
+    def update(self, aggregates, scheduled, current_month):
+        """Переобучает модели, если появились новые закрытые месяцы или правки задним числом"""
+        if not self.available:
+            return
+        months = self.closed_months(aggregates, current_month)
+        # Суммы плановых платежей тоже в отпечатке: меняются при смене правил их отбора
+        scheduled_totals = [sum(scheduled.get(month, {}).values()) for month, _ in months]
+        fingerprint = hashlib.sha256(json.dumps([months, scheduled_totals]).encode('utf-8')).hexdigest()
+        if fingerprint == self.fingerprint:
+            return
+        
+        if self.fingerprint is None and os.path.exists(self.path):
+            try:
+                state = joblib.load(self.path)
+                if state["fingerprint"] == fingerprint:
+                    self.models = state["models"]
+                    self.first_month = state["first_month"]
+                    self.fingerprint = fingerprint
+                    self._predictions = {}
+                    return
+            except (OSError, EOFError, pickle.UnpicklingError, ImportError, AttributeError,
+                    ValueError, KeyError, TypeError) as ex:
+                # Поврежденный файл или модели от несовместимой версии scikit-learn - обучаем заново
+                print(f"Не удалось загрузить модели прогноза {self.path}: {ex!r}; файл будет пересоздан")
+                try:
+                    os.remove(self.path)
+                except OSError:
+                    pass
+        
+        self.train(aggregates, scheduled, [month for month, _ in months])
+        self.fingerprint = fingerprint
+        fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)), suffix=".tmp")
+        os.close(fd)
+        joblib.dump({"fingerprint": fingerprint, "models": self.models, "first_month": self.first_month}, tmp_file)
+        os.replace(tmp_file, self.path)
+    
+    def train(self, aggregates, scheduled, months):
+        self.models = {}
+        self._predictions = {}
+        if len(months) < FORECAST_MIN_MONTHS:
+            return
+        
+        self.first_month = self.month_index(months[0])
+        features = np.array([self.features(self.month_index(month)) for month in months])
+        regular = []
+        for month in months:
+            month_scheduled = scheduled.get(month, {})
+            regular.append({
+                category: amount - month_scheduled.get(category, 0)
+                for category, amount in aggregates.categories.get((month, "expense"), {}).items()
+            })
+        categories = {}
+        for month_amounts in regular:
+            categories.update(month_amounts)
+        
+        for category in categories:
+            amounts = np.array([month_amounts.get(category, 0) / KOPECKS for month_amounts in regular])
+            # Категория только из плановых платежей (например, квартплата без категории)
+            if not amounts.any():
+                continue
+            self.models[category] = Ridge(alpha=1.0).fit(features, amounts)
+    
+    def predict(self, month):
+        """Прогноз расходов по категориям на месяц YYYY-MM в рублях (None, если модели нет)"""
+        if not self.models:
+            return None
+        if month not in self._predictions:
+            row = np.array([self.features(self.month_index(month))])
+            self._predictions[month] = {
+                category: max(0.0, float(model.predict(row)[0]))
+                for category, model in self.models.items()
+            }
+        return self._predictions[month]
+
+# Слова в описании, по которым расход считается импульсивным / неожиданным подарком
+IMPULSE_WORDS = ("импульс", "спонтан", "внезапно", "быстро")
+GIFT_WORDS = ("подарок", "сюрприз", "неожиданно")
+
+# Выброс - расход выше среднего по категории на ANOMALY_Z стандартных отклонений,
+# когда по категории уже есть ANOMALY_MIN_SAMPLES расходов
+ANOMALY_Z = 3.0
+ANOMALY_MIN_SAMPLES = 5
+
+class AnomalyDetector:
+    """Потоковый поиск импульсивных и необычных расходов.
+    
+    Для каждой категории хранятся число расходов, среднее и сумма квадратов отклонений
+    (алгоритм Уэлфорда), поэтому каждая новая транзакция проверяется за O(1) и отметка
+    сохраняется в Transaction.flag; историю повторно перебирать не нужно.
+    """
+    
+    def __init__(self, transactions=()):
+        # категория -> [число, среднее, сумма квадратов отклонений] в копейках
+        self.stats = {}
+        self.flagged = []
+        for t in transactions:
+            self.add(t)
+    
+    def add(self, t):
+        if t.type != "expense":
+            return
+        
+        description = str(t.source.get("description", "")).lower()
+        count, mean, m2 = self.stats.get(t.category, (0, 0.0, 0.0))
+        if any(word in description for word in IMPULSE_WORDS):
+            t.flag = "impulse"
+        elif t.amount > 5000 * KOPECKS and any(word in description for word in GIFT_WORDS):
+            t.flag = "gift"
+        elif count >= ANOMALY_MIN_SAMPLES and m2 > 0:
+            # Сравниваем с историей категории до этой транзакции
+            if (t.amount - mean) / math.sqrt(m2 / (count - 1)) > ANOMALY_Z:
+                t.flag = "outlier"
+        if t.flag is not None:
+            self.flagged.append(t)
+        
+        count += 1
+        delta = t.amount - mean
+        mean += delta / count
+        m2 += delta * (t.amount - mean)
+        self.stats[t.category] = (count, mean, m2)
+
+class ColumnarTransactionStore:
+    """Колоночная копия транзакций на NumPy: суммы в копейках, время, код типа и код категории.
+    
+    Массивы .npy открываются при запуске через memory map. По ним Transaction, индекс сумм
+    и индекс по дате строятся без разбора даты каждой строки (сортировка, группировка и
+    префиксные суммы - векторные операции). Копия относится к началу списка транзакций;
+    записи, добавленные после нее, разбираются как обычно.
+    """
+    
+    # Метка времени для нераспознанной даты
+    NO_TIMESTAMP = -(2 ** 62)
+    
+    def __init__(self, amounts, timestamps, types, categories, type_table, category_table, last_signature):
+        self.amounts = amounts
+        self.timestamps = timestamps
+        self.types = types
+        self.categories = categories
+        self.type_table = type_table
+        self.category_table = category_table
+        self.last_signature = last_signature
+    
+    def __len__(self):
+        return len(self.amounts)
+    
+    @staticmethod
+    def signature(transaction):
+        """Отпечаток последней записи, по которому копия сверяется с данными"""
+        return [transaction["date"], transaction["amount"], transaction["type"]]
+    
+    @classmethod
+    def from_ledger(cls, ledger):
+        """Колонки по списку Transaction (типы и категории кодируются по таблицам значений)"""
+        type_codes = {}
+        category_codes = {}
+        types = [type_codes.setdefault(t.type, len(type_codes)) for t in ledger]
+        categories = [category_codes.setdefault(t.category, len(category_codes)) for t in ledger]
+        return cls(
+            np.array([t.amount for t in ledger], dtype=np.int64),
+            np.array([cls.NO_TIMESTAMP if t.timestamp is None else t.timestamp for t in ledger], dtype=np.int64),
+            np.array(types, dtype=np.int32),
+            np.array(categories, dtype=np.int32),
+            list(type_codes),
+            list(category_codes),
+            cls.signature(ledger[-1].source) if ledger else None
+        )
+    
+    @classmethod
+    def load(cls, directory):
+        """Открывает сохраненные массивы через memory map, не читая их в память"""
+        with open(os.path.join(directory, "columns.json"), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        arrays = [
+            np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r')
+            for name in ("amounts", "timestamps", "types", "categories")
+        ]
+        if any(len(array) != meta["count"] for array in arrays):
+            raise ValueError("Колоночная копия повреждена")
+        return cls(*arrays, meta["types"], meta["categories"], meta["last_signature"])
+    
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        meta_file = os.path.join(directory, "columns.json")
+        # Метаданные пишутся последними: без них частично записанный каталог не читается
+        if os.path.exists(meta_file):
+            os.remove(meta_file)
+        np.save(os.path.join(directory, "amounts.npy"), self.amounts)
+        np.save(os.path.join(directory, "timestamps.npy"), self.timestamps)
+        np.save(os.path.join(directory, "types.npy"), self.types)
+        np.save(os.path.join(directory, "categories.npy"), self.categories)
+        fd, tmp_file = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({
+                "count": len(self),
+                "types": self.type_table,
+                "categories": self.category_table,
+                "last_signature": self.last_signature
+            }, f, ensure_ascii=False)
+        os.replace(tmp_file, meta_file)
+    
+    def matches(self, transactions):
+        """Копия совпадает с началом списка transactions"""
+        count = len(self)
+        if count > len(transactions):
+            return False
+        return count == 0 or self.signature(transactions[count - 1]) == self.last_signature
+    
+    def restore(self, transactions):
+        """(ledger, AggregateIndex, DateIndex) для первых len(self) записей transactions"""
+        count = len(self)
+        amounts = np.asarray(self.amounts)
+        timestamps = np.asarray(self.timestamps)
+        types = np.asarray(self.types)
+        categories = np.asarray(self.categories)
+        dated = timestamps != self.NO_TIMESTAMP
+        
+        # Календарь по времени эпохи (UTC, как в transaction_timestamp): 1970-01-01 - четверг
+        days = np.where(dated, timestamps, 0) // 86400
+        months = days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+        weekdays = (days + 3) % 7
+        
+        month_keys = {}
+        for month in np.unique(months[dated]).tolist():
+            year, month_number = divmod(month, 12)
+            month_keys[month] = (sys.intern(month_key(year + 1970, month_number + 1)), year + 1970, month_number + 1)
+        type_table = [sys.intern(transaction_type) for transaction_type in self.type_table]
+        category_table = [sys.intern(category) if isinstance(category, str) else category for category in self.category_table]
+        
+        ledger = []
+        rows = zip(
+            transactions[:count], amounts.tolist(), timestamps.tolist(), types.tolist(),
+            categories.tolist(), months.tolist(), weekdays.tolist(), dated.tolist()
+        )
+        for source, amount, timestamp, type_code, category_code, month, weekday, has_date in rows:
+            if has_date:
+                key, year, month_number = month_keys[month]
+                ledger.append(Transaction.restore(
+                    source, type_table[type_code], category_table[category_code], amount,
+                    timestamp, key, year, month_number, weekday
+                ))
+            else:
+                ledger.append(Transaction.restore(
+                    source, type_table[type_code], category_table[category_code], amount,
+                    None, None, None, None, None
+                ))
+        
+        # Суммы по (месяц, тип, категория): сортировка по составному ключу и reduceat
+        sums = {}
+        month_versions = {}
+        if dated.any():
+            base = months[dated].min()
+            type_count = max(len(type_table), 1)
+            category_count = max(len(category_table), 1)
+            group = ((months[dated] - base) * type_count + types[dated]) * category_count + categories[dated]
+            order = np.argsort(group, kind="stable")
+            group = group[order]
+            starts = np.flatnonzero(np.concatenate(([True], group[1:] != group[:-1])))
+            totals = np.add.reduceat(amounts[dated][order], starts)
+            for key, amount in zip(group[starts].tolist(), totals.tolist()):
+                key, category_code = divmod(key, category_count)
+                month, type_code = divmod(key, type_count)
+                month_entry = (month_keys[month + base][0], type_table[type_code])
+                sums.setdefault(month_entry, {})[category_table[category_code]] = amount
+            unique_months, counts = np.unique(months[dated], return_counts=True)
+            month_versions = {month_keys[month][0]: count for month, count in zip(unique_months.tolist(), counts.tolist())}
+        
+        # Порядок по дате (устойчивый, как sorted) и префиксные суммы движения денег
+        positions = np.flatnonzero(dated)
+        positions = positions[np.argsort(timestamps[positions], kind="stable")]
+        signs = np.array([BALANCE_SIGNS.get(transaction_type, 0) for transaction_type in type_table] or [0], dtype=np.int64)
+        flows = signs[types[positions]] * amounts[positions]
+        date_index = DateIndex.from_sorted(
+            [ledger[i] for i in positions.tolist()],
+            timestamps[positions].tolist(),
+            [0] + np.cumsum(flows).tolist()
+        )
+        return ledger, AggregateIndex.from_sums(sums, month_versions), date_index
+
+def default_settings():
+    """Настройки по умолчанию (подарки, бюджет, уведомления)"""
+    return {
+        "gift_percentage": 0.1,
+        "gift_settings": {
+            "general_percentage": 0.1,
+            "relationship_percentages": {
+                "Семья": 0.15,
+                "Девушка/Парень": 0.2,
+                "Друзья": 0.08,
+                "Коллеги": 0.05,
+                "Дети": 0.12,
+                "Родители": 0.18,
+                "Бабушка/Дедушка": 0.1
+            },
+            "gift_categories": {
+                "Цветы": 0.3,
+                "Косметика": 0.25,
+                "Одежда": 0.2,
+                "Электроника": 0.15,
+                "Книги": 0.1
+            },
+            "max_gift_amount": 10000,
+            "min_gift_amount": 500,
+            "holiday_multiplier": 1.5
+        },
+        "budget_categories": {
+            "Еда": 0.3,
+            "Транспорт": 0.15,
+            "Развлечения": 0.1,
+            "Одежда": 0.1,
+            "Здоровье": 0.1,
+            "Образование": 0.05,
+            "Прочее": 0.2
+        },
+        "safety_reserve_months": 3,
+        "theme": "light",
+        "currency": "RUB",
+        "auto_save": True,
+        "notifications": {
+            "salary_reminder": True,
+            "budget_warning": True,
+            "goal_reminder": True,
+            "birthday_reminder": True
+        },
+        "default_goals": {
+            "emergency_fund": 100000,
+            "vacation_fund": 50000,
+            "investment_fund": 200000
+        }
+    }
+
+def default_data():
+    """Данные нового пользователя в актуальной версии схемы"""
+    return {
+        "schema_version": SCHEMA_VERSION,
+        "salary": 0,
+        "current_money": 0,
+        "transactions": [],
+        "goals": [],
+        "monthly_budget": {},
+        "goal_investments": {},
+        "salary_dates": [8, 22],
+        "rent": 0,
+        "rent_paid_until": None,
+        "safety_reserve": 20000,
+        "chatgpt_enabled": True,
+        "birthdays": [],
+        "notes": [],
+        "settings": default_settings()
+    }
+
+def migrate_to_v1(data):
+    """Ключи, появившиеся после первой версии (цели, зарплата, квартплата, дни рождения, заметки)"""
+    data.setdefault("goal_investments", {})
+    data.setdefault("salary_dates", [8, 22])
+    data.setdefault("rent", 0)
+    data.setdefault("rent_paid_until", None)
+    data.setdefault("safety_reserve", 20000)
+    data.setdefault("chatgpt_enabled", True)
+    data.setdefault("birthdays", [])
+    data.setdefault("notes", [])
+
+def migrate_to_v2(data):
+    """Раздел настроек"""
+    data.setdefault("settings", default_settings())
+
+# Шаги миграции схемы по возрастанию версии; каждый выполняется один раз
+SCHEMA_MIGRATIONS = [
+    (1, migrate_to_v1),
+    (2, migrate_to_v2),
+]
+SCHEMA_VERSION = SCHEMA_MIGRATIONS[-1][0]
+
+class FinanceApp:
+    def __init__(self, save_delay=SAVE_DELAY, storage=STORAGE_BACKEND):
         self.data_file = "finance_data.json"
+        self.journal_file = "finance_data.journal"
+        self.db = SqliteStorage("finance_data.db") if storage == "sqlite" else None
+        self.columns_dir = "finance_data.columns"
+        self.seasonality_file = "finance_data.seasonality.json"
+        self.seasonal_model = None
+        self.forecaster = ExpenseForecaster("finance_data.forecast.joblib")
+        self.save_delay = save_delay
+        # Растет при каждом изменении данных; по нему сбрасываются кэши аналитики
+        self.data_version = 0
+        # Общая блокировка ленивых индексов и записи на диск: к ним обращаются обработчики UI,
+        # таймер сохранения и фоновые сборки страниц
+        self.lock = threading.RLock()
+        self._save_timer = None
+        self._compact_on_load = False
+        # Сообщение для пользователя, если данные пришлось восстанавливать из резервного снимка
+        self.recovery_notice = None
         self.load_data()
+        self.ledger = []
+        self._ledger_source = None
+        self.aggregates = AggregateIndex()
+        self.date_index = DateIndex()
+        self.anomalies = AnomalyDetector()
+        # Плановые платежи по месяцам и категориям, дополняются вместе с ledger
+        self._scheduled = {}
+        self._scheduled_source = None
+        self._scheduled_count = 0
+        columns_fresh = self.load_ledger()
+        if self._compact_on_load:
+            # Сворачивание после загрузки заодно перезапишет колоночную копию
+            self.compact()
+        elif not columns_fresh:
+            self.save_columns()
+        atexit.register(self.close)
         
     def load_data(self):
-        if os.path.exists(self.data_file):
-            with open(self.data_file, 'r', encoding='utf-8') as f:
-                self.data = json.load(f)
-                if "goal_investments" not in self.data:
-                    self.data["goal_investments"] = {}
-                if "salary_dates" not in self.data:
-                    self.data["salary_dates"] = [8, 22]
-                if "rent" not in self.data:
-                    self.data["rent"] = 0
-                if "rent_paid_until" not in self.data:
-                    self.data["rent_paid_until"] = None
-                if "safety_reserve" not in self.data:
-                    self.data["safety_reserve"] = 20000
-                if "chatgpt_enabled" not in self.data:
-                    self.data["chatgpt_enabled"] = True
-                if "birthdays" not in self.data:
-                    self.data["birthdays"] = []
-                if "notes" not in self.data:
-                    self.data["notes"] = []
-                if "settings" not in self.data:
-                    self.data["settings"] = {
-                        "gift_percentage": 0.1,
-                        "gift_settings": {
-                            "general_percentage": 0.1,
-                            "relationship_percentages": {
-                                "Семья": 0.15,
-                                "Девушка/Парень": 0.2,
-                                "Друзья": 0.08,
-                                "Коллеги": 0.05,
-                                "Дети": 0.12,
-                                "Родители": 0.18,
-                                "Бабушка/Дедушка": 0.1
-                            },
-                            "gift_categories": {
-                                "Цветы": 0.3,
-                                "Косметика": 0.25,
-                                "Одежда": 0.2,
-                                "Электроника": 0.15,
-                                "Книги": 0.1
-                            },
-                            "max_gift_amount": 10000,
-                            "min_gift_amount": 500,
-                            "holiday_multiplier": 1.5
-                        },
-                        "budget_categories": {
-                            "Еда": 0.3,
-                            "Транспорт": 0.15,
-                            "Развлечения": 0.1,
-                            "Одежда": 0.1,
-                            "Здоровье": 0.1,
-                            "Образование": 0.05,
-                            "Прочее": 0.2
-                        },
-                        "safety_reserve_months": 3,
-                        "theme": "light",
-                        "currency": "RUB",
-                        "auto_save": True,
-                        "notifications": {
-                            "salary_reminder": True,
-                            "budget_warning": True,
-                            "goal_reminder": True,
-                            "birthday_reminder": True
-                        },
-                        "default_goals": {
-                            "emergency_fund": 100000,
-                            "vacation_fund": 50000,
-                            "investment_fund": 200000
-                        }
-                    }
+        if self.db is not None and not self.db.is_empty():
+            self.data = self.db.load()
+            migrated = self.migrate()
+            self._mark_journaled()
+            if migrated:
+                self.db.replace_all(self.data)
+            return
+        
+        snapshot = self.read_snapshot()
+        if snapshot is not None:
+            self.data, snapshot_seq = snapshot
+            self.replay_journal(snapshot_seq)
         else:
-            self.data = {
-                "salary": 0,
-                "current_money": 0,
-                "transactions": [],
-                "goals": [],
-                "monthly_budget": {},
-                "goal_investments": {},
-                "salary_dates": [8, 22],
-                "rent": 0,
-                "rent_paid_until": None,
-                "safety_reserve": 20000,
-                "chatgpt_enabled": True,
-                "birthdays": [],
-                "notes": [],
-                "settings": {
-                    "gift_percentage": 0.1,
-                    "gift_settings": {
-                        "general_percentage": 0.1,
-                        "relationship_percentages": {
-                            "Семья": 0.15,
-                            "Девушка/Парень": 0.2,
-                            "Друзья": 0.08,
-                            "Коллеги": 0.05,
-                            "Дети": 0.12,
-                            "Родители": 0.18,
-                            "Бабушка/Дедушка": 0.1
-                        },
-                        "gift_categories": {
-                            "Цветы": 0.3,
-                            "Косметика": 0.25,
-                            "Одежда": 0.2,
-                            "Электроника": 0.15,
-                            "Книги": 0.1
-                        },
-                        "max_gift_amount": 10000,
-                        "min_gift_amount": 500,
-                        "holiday_multiplier": 1.5
-                    },
-                    "budget_categories": {
-                        "Еда": 0.3,
-                        "Транспорт": 0.15,
-                        "Развлечения": 0.1,
-                        "Одежда": 0.1,
-                        "Здоровье": 0.1,
-                        "Образование": 0.05,
-                        "Прочее": 0.2
-                    },
-                    "safety_reserve_months": 3,
-                    "theme": "light",
-                    "currency": "RUB",
-                    "auto_save": True,
-                    "notifications": {
-                        "salary_reminder": True,
-                        "budget_warning": True,
-                        "goal_reminder": True,
-                        "birthday_reminder": True
-                    },
-                    "default_goals": {
-                        "emergency_fund": 100000,
-                        "vacation_fund": 50000,
-                        "investment_fund": 200000
-                    }
-                }
-            }
+            self.data = default_data()
+            self.replay_journal(0)
+        migrated = self.migrate()
+        if self._snapshot_recovered:
+            self.recovery_notice = f"Файл данных поврежден, данные восстановлены из резервного снимка от {self._snapshot_saved_at}"
+            if self._journal_damaged:
+                self.recovery_notice += "; часть последних изменений восстановить не удалось"
+        
+        self._mark_journaled()
+        if self.db is not None:
+            # Первый запуск с SQLite: переносим данные из finance_data.json в базу
+            self.db.replace_all(self.data)
+        elif snapshot is None:
+            # Первое сохранение запишет полный снимок
+            self._journaled_transactions = None
+        elif migrated or self._snapshot_recovered or self._journal_damaged or self._journal_size > JOURNAL_COMPACT_THRESHOLD:
+            # Сворачиваем после построения индексов транзакций (см. __init__)
+            self._compact_on_load = True
+    
+    def migrate(self):
+        """Применяет недостающие шаги миграции схемы; возвращает True, если данные изменились"""
+        version = self.data.get("schema_version", 0)
+        if version >= SCHEMA_VERSION:
+            return False
+        
+        for step_version, step in SCHEMA_MIGRATIONS:
+            if step_version > version:
+                step(self.data)
+                self.data["schema_version"] = step_version
+        return True
+    
+    def save_data(self, immediate=False):
+        """Помечает данные измененными; запись на диск откладывается на save_delay секунд"""
+        with self.lock:
+            self.data_version += 1
+        if immediate or self.save_delay <= 0:
+            self.flush()
+            return
+        
+        # Каждое новое изменение переносит запись: серия правок дает одну запись
+        with self.lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+            self._save_timer = threading.Timer(self.save_delay, self._flush_in_background)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+    
+    def flush(self):
+        """Немедленно записывает все накопленные изменения"""
+        with self.lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+                self._save_timer = None
+            self.write_changes()
+    
+    def close(self):
+        """Сохраняет несохраненные изменения перед закрытием приложения"""
+        self.flush()
+    
+    def _flush_in_background(self):
+        try:
+            self.flush()
+        except RuntimeError:
+            # Данные изменились прямо во время записи - попробуем в следующем окне
+            self.save_data()
+    
+    def write_changes(self):
+        """Дописывает изменения в журнал (или в базу SQLite), при необходимости делает снимок"""
+        transactions = self.data["transactions"]
+        
+        # Список транзакций заменили или укоротили - журналом это не выразить
+        if transactions is not self._journaled_transactions or len(transactions) < self._journaled_count:
+            self.compact()
+            return
+        
+        transactions_count = len(transactions)
+        appended = transactions[self._journaled_count:transactions_count]
+        
+        changed = {}
+        changed_values = {}
+        for key, value in list(self.data.items()):
+            if key == "transactions":
+                continue
+            serialized = json.dumps(value, ensure_ascii=False, sort_keys=True)
+            if self._journaled_values.get(key) != serialized:
+                changed[key] = value
+                changed_values[key] = serialized
+        
+        deleted_keys = [key for key in self._journaled_values if key not in self.data]
+        
+        if not appended and not changed and not deleted_keys:
+            return
+        
+        if self.db is not None:
+            self.db.apply_changes(appended, changed, deleted_keys)
+        else:
+            records = [{"op": "append", "key": "transactions", "value": t} for t in appended]
+            records += [{"op": "set", "key": key, "value": value} for key, value in changed.items()]
+            records += [{"op": "delete", "key": key} for key in deleted_keys]
+            
+            lines = []
+            for record in records:
+                self._journal_seq += 1
+                record["seq"] = self._journal_seq
+                lines.append(json.dumps(record, ensure_ascii=False) + "\n")
+            with open(self.journal_file, 'a', encoding='utf-8') as f:
+                f.write("".join(lines))
+                f.flush()
+                os.fsync(f.fileno())
+            self._journal_size += len(records)
+        
+        self._journaled_count = transactions_count
+        self._journaled_values.update(changed_values)
+        for key in deleted_keys:
+            del self._journaled_values[key]
+        
+        # Правки уже в журнале, поэтому свернутая часть журнала докатывает старые снимки до нового
+        if self.db is None and self._journal_size > JOURNAL_COMPACT_THRESHOLD:
+            self.compact()
+    
+    def add_transaction(self, transaction):
+        """Добавляет транзакцию и сразу сохраняет ее одной записью журнала"""
+        self.data["transactions"].append(transaction)
+        self.save_data(immediate=True)
+    
+    def compact(self):
+        """Записывает полный снимок данных и очищает журнал"""
+        # Снимок и отметка о записанном строятся из одного среза: правка, сделанная
+        # во время записи, не попадет в срез и уйдет в журнал при следующем сохранении
+        state = self._capture_state()
+        if self.db is not None:
+            transactions, written, values = state
+            data = {key: json.loads(text) for key, text in values.items()}
+            data["transactions"] = written
+            self.db.replace_all(data)
+            self._mark_journaled(state)
+            return
+        
+        transactions, written, values = state
+        if transactions is not self._journaled_transactions or len(written) != self._journaled_count or values != self._journaled_values:
+            # В снимок попадают правки, которых нет в журнале: пропуск номера не даст
+            # докатить старый снимок мимо них
+            self._journal_seq += 1
+        self.write_snapshot(state)
+        
+        # Журнал сдвигаем только после записи снимка: при сбое между этими шагами
+        # записи с seq <= journal_seq будут пропущены при чтении. Старые части журнала
+        # хранятся вместе со старыми снимками, чтобы откат к ним не терял правки
+        for index in range(SNAPSHOT_KEEP - 1, 0, -1):
+            older = f"{self.journal_file}.{index}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.journal_file}.{index + 1}")
+        if SNAPSHOT_KEEP > 0 and os.path.exists(self.journal_file):
+            os.replace(self.journal_file, f"{self.journal_file}.1")
+        with open(self.journal_file, 'w', encoding='utf-8'):
+            pass
+        self._fsync_directory()
+        self.save_columns()
+        
+        self._journal_size = 0
+        self._mark_journaled(state)
+    
+    def write_snapshot(self, state=None):
+        """Атомарно записывает снимок: временный файл, fsync, переименование.
+        
+        Первая строка снимка - заголовок с номером поколения, контрольной суммой
+        тела и номером последней вошедшей в него записи журнала. Предыдущие SNAPSHOT_KEEP
+        снимков остаются в finance_data.json.1 ... .N.
+        """
+        transactions, written, values = state or self._capture_state()
+        # Тело собирается из тех же строк, что запоминает _mark_journaled
+        fields = [f"  {json.dumps(key, ensure_ascii=False)}: {text}" for key, text in values.items()]
+        fields.append('  "transactions": ' + json.dumps(written, ensure_ascii=False, indent=2))
+        body = ("{\n" + ",\n".join(fields) + "\n}").encode('utf-8')
+        self._snapshot_generation += 1
+        header = {
+            "snapshot": 1,
+            "generation": self._snapshot_generation,
+            "journal_seq": self._journal_seq,
+            "sha256": hashlib.sha256(body).hexdigest(),
+            "saved_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+        temp_file = self.data_file + ".tmp"
+        with open(temp_file, 'wb') as f:
+            f.write(json.dumps(header).encode('utf-8') + b"\n")
+            f.write(body)
+            f.flush()
+            os.fsync(f.fileno())
+        
+        # Сдвигаем старые снимки: .N-1 -> .N, ..., текущий -> .1
+        for index in range(SNAPSHOT_KEEP - 1, 0, -1):
+            older = f"{self.data_file}.{index}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.data_file}.{index + 1}")
+        if SNAPSHOT_KEEP > 0 and os.path.exists(self.data_file):
+            os.replace(self.data_file, f"{self.data_file}.1")
+        os.replace(temp_file, self.data_file)
+        self._fsync_directory()
+    
+    def read_snapshot(self):
+        """Находит самый свежий целый снимок и возвращает (данные, journal_seq) или None.
+        
+        Кандидаты упорядочиваются по заголовкам; JSON разбирается только у
+        первого снимка, чья контрольная сумма сошлась.
+        """
+        self._snapshot_recovered = False
+        self._snapshot_generation = 0
+        self._snapshot_saved_at = None
+        candidates = []
+        legacy = []
+        paths = [self.data_file, self.data_file + ".tmp"]
+        paths += [f"{self.data_file}.{index}" for index in range(1, SNAPSHOT_KEEP + 1)]
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            try:
+                with open(path, 'rb') as f:
+                    first_line = f.readline()
+                header = json.loads(first_line) if first_line.startswith(b'{"snapshot"') else None
+            except (OSError, ValueError):
+                continue
+            if header is None:
+                # Файл старого формата (обычный JSON без заголовка)
+                legacy.append(path)
+            else:
+                candidates.append((header["generation"], path, header))
+        
+        candidates.sort(reverse=True)
+        for generation, path, header in candidates:
+            with open(path, 'rb') as f:
+                f.readline()
+                body = f.read()
+            if hashlib.sha256(body).hexdigest() != header["sha256"]:
+                continue
+            self._snapshot_recovered = path != self.data_file
+            self._snapshot_generation = candidates[0][0]
+            self._snapshot_saved_at = header.get("saved_at")
+            return json.loads(body.decode('utf-8')), header["journal_seq"]
+        
+        for path in legacy:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            self._snapshot_recovered = path != self.data_file
+            self._snapshot_saved_at = datetime.fromtimestamp(os.path.getmtime(path)).strftime("%Y-%m-%d %H:%M:%S")
+            return data, data.pop("journal_seq", 0)
+        
+        return None
+    
+    def _fsync_directory(self):
+        # Фиксируем переименование на диске; на Windows каталог так открыть нельзя
+        directory = os.path.dirname(os.path.abspath(self.data_file))
+        try:
+            fd = os.open(directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+    
+    def replay_journal(self, snapshot_seq):
+        """Применяет к загруженному снимку записи журнала, сделанные после него.
+        
+        Если снимок взят из резервной копии, сначала проигрываются свернутые части
+        журнала (.N ... .1). Записи применяются только подряд по seq: после пропуска
+        или битой строки остальное не применяется, но их номера больше не выдаются.
+        """
+        self._journal_seq = snapshot_seq
+        self._journal_size = 0
+        self._journal_damaged = False
+        paths = [self.journal_file]
+        if self._snapshot_recovered:
+            paths = [f"{self.journal_file}.{index}" for index in range(SNAPSHOT_KEEP, 0, -1)] + paths
+        
+        last_seq = snapshot_seq
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Недописанная последняя строка после аварийного завершения
+                        self._journal_damaged = True
+                        break
+                    
+                    if path == self.journal_file:
+                        self._journal_size += 1
+                    last_seq = max(last_seq, record["seq"])
+                    if record["seq"] <= self._journal_seq or self._journal_damaged:
+                        continue
+                    if record["seq"] != self._journal_seq + 1:
+                        # Между снимком и записью пропали правки
+                        self._journal_damaged = True
+                        continue
+                    
+                    if record["op"] == "append":
+                        self.data.setdefault(record["key"], []).append(record["value"])
+                    elif record["op"] == "set":
+                        self.data[record["key"]] = record["value"]
+                    elif record["op"] == "delete":
+                        self.data.pop(record["key"], None)
+                    self._journal_seq = record["seq"]
+        
+        if self._journal_damaged:
+            self._journal_seq = last_seq
+    
+    def category_totals(self, transaction_type, start, end):
+        """Суммы транзакций типа transaction_type по категориям за период [start, end)"""
+        with self.lock:
+            transactions = self.data["transactions"]
+            # База отвечает только если в ней уже все транзакции из памяти
+            if self.db is not None and transactions is self._journaled_transactions and len(transactions) == self._journaled_count:
+                return self.db.category_totals(transaction_type, start, end)
+            
+            totals = {}
+            for t in self.transactions_between(start, end):
+                if t.type == transaction_type:
+                    totals[t.category] = totals.get(t.category, 0) + t.amount
+            return {category: amount / KOPECKS for category, amount in totals.items()}
+    
+    def total(self, transaction_type, start, end):
+        """Сумма транзакций типа transaction_type за период [start, end)"""
+        return sum(self.category_totals(transaction_type, start, end).values())
+    
+    def export_json(self, path):
+        """Выгружает все данные в обычный JSON того же формата, что и finance_data.json"""
+        with self.lock:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(self.data, f, ensure_ascii=False, indent=2)
+    
+    def load_ledger(self):
+        """Строит индексы транзакций при запуске - по колоночной копии, если она совпадает с данными.
+        
+        Возвращает True, если копия покрывает все транзакции и перезаписывать ее не нужно.
+        """
+        transactions = self.data["transactions"]
+        columns = None
+        if np is not None and os.path.exists(os.path.join(self.columns_dir, "columns.json")):
+            try:
+                columns = ColumnarTransactionStore.load(self.columns_dir)
+            except (OSError, ValueError, KeyError):
+                columns = None
+            if columns is not None and not columns.matches(transactions):
+                columns = None
+        
+        with self.lock:
+            if columns is not None and len(columns):
+                self.ledger, self.aggregates, self.date_index = columns.restore(transactions)
+                self._ledger_source = transactions
+                self.anomalies = AnomalyDetector(self.ledger)
+            # Записи после копии (или все, если копии нет) разбираются как обычно
+            self.get_ledger()
+        return np is None or (columns is not None and len(columns) == len(transactions))
+    
+    def save_columns(self):
+        """Перезаписывает колоночную копию по текущему списку транзакций (нужен numpy)"""
+        if np is None:
+            return
+        with self.lock:
+            columns = ColumnarTransactionStore.from_ledger(self.get_ledger())
+        columns.save(self.columns_dir)
+    
+    def get_ledger(self):
+        """Транзакции в виде Transaction, синхронизированные с data["transactions"]"""
+        with self.lock:
+            transactions = self.data["transactions"]
+            if transactions is not self._ledger_source or len(transactions) < len(self.ledger):
+                self.ledger = [Transaction(t) for t in transactions]
+                self._ledger_source = transactions
+                self.aggregates = AggregateIndex(self.ledger)
+                self.date_index = DateIndex(self.ledger)
+                self.anomalies = AnomalyDetector(self.ledger)
+            elif len(transactions) > len(self.ledger):
+                added = [Transaction(source) for source in transactions[len(self.ledger):]]
+                for t in added:
+                    self.ledger.append(t)
+                    self.aggregates.add(t)
+                    self.anomalies.add(t)
+                self.date_index.extend(added)
+            return self.ledger
+    
+    def transactions_between(self, start, end):
+        """Транзакции (Transaction) за период [start, end) в порядке дат; границы в формате YYYY-MM-DD[ HH:MM]"""
+        with self.lock:
+            self.get_ledger()
+            return self.date_index.between(transaction_timestamp(start), transaction_timestamp(end))
+    
+    def balance_at(self, moment):
+        """Баланс на момент moment (YYYY-MM-DD[ HH:MM]) - до транзакций, сделанных в этот момент и позже.
+        
+        Считается от текущего current_money назад по префиксным суммам, без перебора истории.
+        """
+        with self.lock:
+            self.get_ledger()
+            later_flow = self.date_index.total_flow() - self.date_index.flow_before(transaction_timestamp(moment))
+            return self.data["current_money"] - later_flow / KOPECKS
+    
+    def net_flow(self, start, end):
+        """Чистое изменение баланса за период [start, end)"""
+        with self.lock:
+            self.get_ledger()
+            index = self.date_index
+            return (index.flow_before(transaction_timestamp(end)) - index.flow_before(transaction_timestamp(start))) / KOPECKS
+    
+    def latest_transactions(self, count):
+        """Последние по дате транзакции (Transaction), от старых к новым"""
+        with self.lock:
+            self.get_ledger()
+            return self.date_index.latest(count)
+    
+    def get_anomalies(self):
+        """Детектор импульсивных и необычных расходов, синхронизированный с транзакциями"""
+        with self.lock:
+            self.get_ledger()
+            return self.anomalies
+    
+    def get_aggregates(self):
+        """Индекс сумм по (месяц, тип, категория), синхронизированный с транзакциями"""
+        with self.lock:
+            self.get_ledger()
+            return self.aggregates
+    
+    def get_seasonal_model(self):
+        """Сезонная модель, дополненная месяцами, закрывшимися с прошлого расчета"""
+        with self.lock:
+            if self.seasonal_model is None:
+                self.seasonal_model = SeasonalModel.load(self.seasonality_file)
+            if self.seasonal_model.update(self.get_aggregates(), datetime.now().strftime("%Y-%m")):
+                self.seasonal_model.save(self.seasonality_file)
+            return self.seasonal_model
+    
+    def get_scheduled_expenses(self):
+        """Плановые платежи: {YYYY-MM: {категория: копейки}}; новые транзакции досчитываются"""
+        with self.lock:
+            ledger = self.get_ledger()
+            if self._scheduled_source is not ledger:
+                self._scheduled = {}
+                self._scheduled_source = ledger
+                self._scheduled_count = 0
+            for t in ledger[self._scheduled_count:]:
+                if t.type == "expense" and t.month_key is not None and is_scheduled_expense(t.source):
+                    categories = self._scheduled.setdefault(t.month_key, {})
+                    categories[t.category] = categories.get(t.category, 0) + t.amount
+            self._scheduled_count = len(ledger)
+            return self._scheduled
+    
+    def monthly_expense_history(self):
+        """Обычные расходы в рублях по закрытым месяцам с расходами, от старых к новым.
+        
+        Месяцы только с доходами в выборку не попадают. Плановые платежи (оплата квартплаты)
+        не входят: в прогнозе баланса они уже вычитаются по календарю.
+        """
+        with self.lock:
+            aggregates = self.get_aggregates()
+            scheduled = self.get_scheduled_expenses()
+            current_month = datetime.now().strftime("%Y-%m")
+            return [
+                (aggregates.totals[(month, transaction_type)] - sum(scheduled.get(month, {}).values())) / KOPECKS
+                for month, transaction_type in sorted(aggregates.totals)
+                if transaction_type == "expense" and month < current_month and aggregates.totals[(month, transaction_type)]
+            ]
     
-    def save_data(self):
-        with open(self.data_file, 'w', encoding='utf-8') as f:
-            json.dump(self.data, f, ensure_ascii=False, indent=2)
+    def get_forecaster(self):
+        """Прогноз обычных расходов, переобученный при появлении новых закрытых месяцев"""
+        with self.lock:
+            self.forecaster.update(self.get_aggregates(), self.get_scheduled_expenses(), datetime.now().strftime("%Y-%m"))
+            return self.forecaster
+    
+    def _capture_state(self):
+        """Срез данных для записи: (список транзакций, копия его содержимого, ключ -> JSON остальных данных)"""
+        transactions = self.data["transactions"]
+        written = list(transactions)
+        values = {
+            key: json.dumps(value, ensure_ascii=False, sort_keys=True)
+            for key, value in list(self.data.items())
+            if key != "transactions"
+        }
+        return transactions, written, values
+    
+    def _mark_journaled(self, state=None):
+        """Запоминает состояние, которое уже отражено в снимке и журнале (по умолчанию - текущие данные)"""
+        transactions, written, values = state or self._capture_state()
+        self._journaled_transactions = transactions
+        self._journaled_count = len(written)
+        self._journaled_values = values
+
+# Горизонт календаря движения денег (дней) и день оплаты квартплаты
+CASHFLOW_DAYS = 365
+RENT_DAY = 10
+
+# Базовые расходы на жизнь, пока нет ни одного закрытого месяца с тратами,
+# и сколько последних закрытых месяцев усредняется
+BASE_MONTHLY_EXPENSES = 10000
+AVERAGE_EXPENSE_MONTHS = 6
+
+# Праздники с обязательными тратами: (месяц, день) -> (название, сумма), как в прогнозе по месяцам
+CASHFLOW_HOLIDAYS = {
+    (2, 14): ("День Святого Валентина", 5000),
+    (3, 8): ("8 Марта", 3000),
+    (12, 31): ("Новый год", 20000)
+}
+
+# Поля данных, из которых строится календарь движения денег (кроме дня и средних трат)
+CASHFLOW_INPUTS = ("current_money", "safety_reserve", "salary", "salary_dates", "rent", "rent_paid_until",
+                   "chatgpt_enabled", "birthdays")
+
+class CashflowCalendar:
+    """Прогноз движения денег по дням на год вперед (день 0 - сегодня).
+    
+    Зарплаты, квартплата, подписка, дни рождения, праздники и средние ежедневные траты
+    раскладываются по дням один раз; остаток на конец дня, ближайшая зарплата и запас
+    хода до резерва хранятся массивами, поэтому любой запрос по дню - O(1).
+    """
+    
+    def __init__(self, data, start, daily_spend, birthday_months, days=CASHFLOW_DAYS):
+        self.start = start
+        self.events = [[] for _ in range(days)]
+        self.flows = [-daily_spend] * days
+        self.salary_days = set()
+        
+        salary_dates = data["salary_dates"]
+        salary_share = data["salary"] / len(salary_dates) if salary_dates else 0
+        paid_until = parse_transaction_date(data.get("rent_paid_until") or "")
+        paid_until = paid_until.date() if paid_until else None
+        self.rent_due = paid_until is not None and start >= paid_until
+        
+        for i in range(days):
+            day = start + timedelta(days=i)
+            # Зарплата 30-31 числа в коротком месяце приходит в последний день
+            last_day = calendar.monthrange(day.year, day.month)[1]
+            for salary_day in salary_dates:
+                if day.day == min(salary_day, last_day):
+                    self.add_event(i, "Зарплата", salary_share)
+                    self.salary_days.add(i)
+            
+            if day.day == RENT_DAY and (paid_until is None or day >= paid_until):
+                self.add_event(i, "Квартплата", -data["rent"])
+            elif i == 0 and self.rent_due:
+                self.add_event(i, "Квартплата (просрочена)", -data["rent"])
+            
+            if day.day == 1:
+                if data["chatgpt_enabled"]:
+                    self.add_event(i, "ChatGPT Plus", -3000)
+                for birthday in birthday_months.get(day.month, []):
+                    self.add_event(i, f"ДР {birthday['name']}", -birthday.get("cost", 2000))
+            
+            holiday = CASHFLOW_HOLIDAYS.get((day.month, day.day))
+            if holiday:
+                self.add_event(i, holiday[0], -holiday[1])
+        
+        self.balances = list(itertools.accumulate(self.flows, initial=data["current_money"]))[1:]
+        
+        # Для каждого дня - номер дня ближайшей зарплаты (не раньше него)
+        self.next_salary = [None] * days
+        upcoming = None
+        for i in reversed(range(days)):
+            if i in self.salary_days:
+                upcoming = i
+            self.next_salary[i] = upcoming
+        
+        reserve = data["safety_reserve"]
+        self.runway = next((i for i, balance in enumerate(self.balances) if balance < reserve), None)
+    
+    def add_event(self, index, title, amount):
+        self.events[index].append((title, amount))
+        self.flows[index] += amount
+    
+    def index(self, day):
+        """Номер дня в календаре или None, если дата вне горизонта"""
+        offset = (day - self.start).days
+        return offset if 0 <= offset < len(self.flows) else None
+    
+    def days_until_salary(self):
+        return self.next_salary[0]
+    
+    def next_salary_date(self):
+        if self.next_salary[0] is None:
+            return None
+        return self.start + timedelta(days=self.next_salary[0])
+    
+    def balance_on(self, day):
+        index = self.index(day)
+        return self.balances[index] if index is not None else None
+    
+    def events_on(self, day):
+        index = self.index(day)
+        return self.events[index] if index is not None else []
+
+class AnalyticsSnapshot:
+    """Общие для всех страниц показатели, вычисляемые лениво один раз на версию данных.
+    
+    Снимок привязан к (data_version, календарный день): пока данные не менялись,
+    повторная отрисовка страниц берет уже посчитанные значения.
+    """
+    
+    def __init__(self, app, key):
+        self.app = app
+        self.finance_app = app.finance_app
+        self.data = app.finance_app.data
+        self.key = key
+        self.today = datetime.now()
+    
+    @cached_property
+    def current_money(self):
+        return self.data["current_money"]
+    
+    @cached_property
+    def safety_reserve(self):
+        return self.data["safety_reserve"]
+    
+    @cached_property
+    def free_money(self):
+        return self.current_money - self.safety_reserve
+    
+    @cached_property
+    def average_monthly_expenses(self):
+        """Средние обычные расходы за последние AVERAGE_EXPENSE_MONTHS закрытых месяцев.
+        
+        Плановые платежи в историю не входят: квартплата и подписка вычитаются отдельно.
+        Без истории - норма BASE_MONTHLY_EXPENSES.
+        """
+        history = self.finance_app.monthly_expense_history()[-AVERAGE_EXPENSE_MONTHS:]
+        if not history:
+            return BASE_MONTHLY_EXPENSES
+        return sum(history) / len(history)
+    
+    @cached_property
+    def planned_monthly_savings(self):
+        """Зарплата минус средние траты, подписка ChatGPT и квартплата"""
+        rent_cost = self.data.get("rent_cost", 25000)
+        chatgpt_cost = 3000 if self.data["chatgpt_enabled"] else 0
+        return self.data["salary"] - self.average_monthly_expenses - chatgpt_cost - rent_cost
+    
+    @cached_property
+    def current_month_key(self):
+        return self.today.strftime("%Y-%m")
+    
+    @cached_property
+    def month_income(self):
+        return self.finance_app.get_aggregates().total(self.current_month_key, "income")
+    
+    @cached_property
+    def month_expenses(self):
+        return self.finance_app.get_aggregates().total(self.current_month_key, "expense")
+    
+    @cached_property
+    def goal_total(self):
+        return sum(goal["amount"] for goal in self.data["goals"])
+    
+    @cached_property
+    def goal_invested(self):
+        return sum(self.data["goal_investments"].values())
+    
+    @cached_property
+    def birthday_months(self):
+        """Номер месяца -> дни рождения в этом месяце"""
+        months = {}
+        for birthday in self.data["birthdays"]:
+            months.setdefault(self.app.convert_month_to_int(birthday["month"]), []).append(birthday)
+        return months
+    
+    def birthdays_in_month(self, month):
+        return self.birthday_months.get(month, [])
+    
+    @cached_property
+    def cashflow(self):
+        return self.app.get_cashflow(self)
+
+class AnalyticsEngine:
+    """Групповые расчеты для страницы аналитики.
+    
+    С pandas транзакции один раз на версию списка транзакций загружаются в DataFrame и считаются
+    через groupby; без pandas те же ответы дают индексы FinanceApp на чистом Python.
+    """
+    
+    def __init__(self, finance_app):
+        self.finance_app = finance_app
+        self._frame = None
+        self._frame_version = None
+    
+    @property
+    def vectorized(self):
+        return pd is not None
+    
+    def frame(self):
+        """DataFrame транзакций с корректной датой (суммы в копейках)"""
+        with self.finance_app.lock:
+            # Кадр зависит только от транзакций: новый ledger или другая длина.
+            # Правки настроек, целей и заметок его не пересобирают
+            ledger = self.finance_app.get_ledger()
+            if self._frame is None or self._frame_version[0] is not ledger or self._frame_version[1] != len(ledger):
+                self._frame_version = (ledger, len(ledger))
+                ledger = [t for t in ledger if t.timestamp is not None]
+                self._frame = pd.DataFrame({
+                    "timestamp": pd.Series([t.timestamp for t in ledger], dtype="int64"),
+                    "month": [t.month_key for t in ledger],
+                    "weekday": pd.Series([t.weekday for t in ledger], dtype="int64"),
+                    "type": [t.type for t in ledger],
+                    "category": [t.category for t in ledger],
+                    "amount": pd.Series([t.amount for t in ledger], dtype="int64"),
+                })
+            return self._frame
+    
+    def category_totals(self, transaction_type, start, end):
+        """Суммы по категориям за период [start, end) в рублях"""
+        if pd is None:
+            return self.finance_app.category_totals(transaction_type, start, end)
+        
+        frame = self.frame()
+        mask = (
+            (frame["type"] == transaction_type)
+            & (frame["timestamp"] >= transaction_timestamp(start))
+            & (frame["timestamp"] < transaction_timestamp(end))
+        )
+        # dropna=False: транзакции с "category": null тоже считаются (ключ None, как без pandas)
+        sums = frame[mask].groupby("category", dropna=False)["amount"].sum()
+        return {
+            None if pd.isna(category) else category: int(amount) / KOPECKS
+            for category, amount in sums.items()
+        }
+    
+    def monthly_trends(self, window=12, today=None):
+        """Доходы, расходы, сбережения и норма сбережений за последние window месяцев.
+        
+        Все месяцы окна берутся за один проход: groupby по (месяц, тип) в pandas
+        или готовые суммы AggregateIndex без pandas. Строки идут от старых к новым.
+        """
+        months = recent_months(window, today)
+        keys = [month_key(year, month) for year, month in months]
+        
+        if pd is None:
+            aggregates = self.finance_app.get_aggregates()
+            income = [aggregates.total(key, "income") for key in keys]
+            expenses = [aggregates.total(key, "expense") for key in keys]
+        else:
+            frame = self.frame()
+            sums = frame.groupby(["month", "type"])["amount"].sum().unstack(fill_value=0)
+            sums = sums.reindex(index=keys, columns=["income", "expense"], fill_value=0)
+            income = [int(amount) / KOPECKS for amount in sums["income"]]
+            expenses = [int(amount) / KOPECKS for amount in sums["expense"]]
+        
+        trends = []
+        for (year, month), month_income, month_expenses in zip(months, income, expenses):
+            savings = month_income - month_expenses
+            trends.append({
+                "month": f"{month:02d}.{year}",
+                "income": month_income,
+                "expenses": month_expenses,
+                "savings": savings,
+                "savings_rate": (savings / month_income * 100) if month_income > 0 else 0
+            })
+        return trends
+    
+    def weekday_totals(self):
+        """Номер дня недели (0 - понедельник) -> сумма всех транзакций в рублях"""
+        if pd is None:
+            totals = {}
+            for t in self.finance_app.get_ledger():
+                if t.weekday is not None:
+                    totals[t.weekday] = totals.get(t.weekday, 0) + t.amount
+        else:
+            totals = self.frame().groupby("weekday")["amount"].sum().to_dict()
+        return {weekday: int(amount) / KOPECKS for weekday, amount in totals.items()}
+    
+    def calendar_month_averages(self, trends, field):
+        """Номер месяца года -> среднее значение field по строкам трендов"""
+        if pd is None:
+            values = {}
+            for trend in trends:
+                values.setdefault(int(trend["month"].split('.')[0]), []).append(trend[field])
+            return {month: sum(items) / len(items) for month, items in values.items()}
+        
+        frame = pd.DataFrame(trends, columns=["month", field])
+        months = frame["month"].str.split('.').str[0].astype(int)
+        return {int(month): float(value) for month, value in frame.groupby(months)[field].mean().items()}
 
 class MainApp:
+    # Построители страниц по индексу вкладки навигации
+    PAGE_BUILDERS = [
+        "create_home_page",
+        "create_money_page",
+        "create_goals_page",
+        "create_analytics_page",
+        "create_forecast_page",
+        "create_calculator_page",
+        "create_notes_page",
+        "create_settings_page"
+    ]
+    # Тяжелые вкладки (аналитика, прогноз) строятся в фоновом потоке
+    BACKGROUND_PAGES = {3, 4}
+    
     def __init__(self, page: ft.Page):
         self.page = page
         self.finance_app = FinanceApp()
+        self.analytics = None
+        # Календарь движения денег и ключ из его входных данных
+        self.cashflow = None
+        self.cashflow_key = None
+        self.analytics_engine = AnalyticsEngine(self.finance_app)
+        self.transaction_history = TransactionHistory(self.finance_app)
+        # Кэш построенных страниц: индекс вкладки -> (ключ версии, страница)
+        self.page_cache = {}
+        self.settings_version = 0
+        # Секции страниц, подписанные на ключи данных: индекс вкладки -> [(ключи, контейнер, построитель)]
+        self.page_bindings = {}
+        self.build_state = threading.local()
+        # Фоновые сборки: индекс вкладки -> версия, для которой строится страница
+        self.pending_builds = {}
+        self.build_lock = threading.Lock()
         self.purchase_name = ""
         self.purchase_price = 0
         self.purchase_analysis = ft.Text("Введите название товара и цену", size=14, color=ft.Colors.GREY_600)
+        # Анализ покупки считается в фоне после паузы ввода; номер запроса отсекает устаревшие результаты
+        self.purchase_timer = None
+        self.purchase_request = 0
+        self.purchase_lock = threading.Lock()
+        # Расчеты идут по одному: следующий ждет предыдущий и пропускается, если устарел
+        self.purchase_run_lock = threading.Lock()
+        self.purchase_analysis_cache = OrderedDict()
         self.setup_page()
         self.create_main_interface()
+        self.show_recovery_notice()
+    
+    def get_analytics(self):
+        """Снимок показателей для текущей версии данных и текущего дня"""
+        with self.finance_app.lock:
+            key = (self.finance_app.data_version, datetime.now().date())
+            if self.analytics is None or self.analytics.key != key:
+                self.analytics = AnalyticsSnapshot(self, key)
+            return self.analytics
+    
+    def get_cashflow(self, analytics):
+        """Календарь движения денег; строится заново, только если изменились его входные данные"""
+        data = self.finance_app.data
+        with self.finance_app.lock:
+            inputs = json.dumps([data.get(name) for name in CASHFLOW_INPUTS], ensure_ascii=False, sort_keys=True)
+            key = (analytics.today.date(), analytics.average_monthly_expenses, inputs)
+            if self.cashflow is None or self.cashflow_key != key:
+                self.cashflow = CashflowCalendar(data, analytics.today.date(), analytics.average_monthly_expenses / 30,
+                                                 analytics.birthday_months)
+                self.cashflow_key = key
+            return self.cashflow
     
     def setup_page(self):
         self.page.title = "Умное Финансовое Приложение"
@@ -165,6 +1994,22 @@ class MainApp:
         self.page.window_width = 1000
         self.page.window_height = 700
         self.page.padding = 20
+        self.page.on_disconnect = self.on_page_close
+    
+    def on_page_close(self, e):
+        # Отложенные правки не должны потеряться при закрытии окна
+        self.finance_app.close()
+    
+    def show_recovery_notice(self):
+        """Предупреждает, что при запуске данные взяты из резервного снимка"""
+        if self.finance_app.recovery_notice is None:
+            return
+        self.page.snack_bar = ft.SnackBar(
+            content=ft.Text(f"⚠️ {self.finance_app.recovery_notice}"),
+            bgcolor=ft.Colors.ORANGE
+        )
+        self.page.snack_bar.open = True
+        self.page.update()
     
     def create_main_interface(self):
         self.navigation_bar = ft.NavigationBar(
@@ -182,7 +2027,7 @@ class MainApp:
         )
         
         self.main_content = ft.Container(
-            content=self.create_home_page(),
+            content=self.get_page(0),
             expand=True
         )
         
@@ -196,31 +2041,100 @@ class MainApp:
     def on_navigation_change(self, e):
         selected_index = e.control.selected_index
         
-        if selected_index == 0:
-            self.main_content.content = self.create_home_page()
-        elif selected_index == 1:
-            self.main_content.content = self.create_money_page()
-        elif selected_index == 2:
-            self.main_content.content = self.create_goals_page()
-        elif selected_index == 3:
-            self.main_content.content = self.create_analytics_page()
-        elif selected_index == 4:
-            self.main_content.content = self.create_forecast_page()
-        elif selected_index == 5:
-            self.main_content.content = self.create_calculator_page()
-        elif selected_index == 6:
-            self.main_content.content = self.create_notes_page()
-        elif selected_index == 7:
-            self.main_content.content = self.create_settings_page()
+        if 0 <= selected_index < len(self.PAGE_BUILDERS):
+            self.show_page(selected_index)
         
         self.page.update()
     
+    def page_key(self):
+        """Версия, при которой построенная страница остается актуальной: данные, настройки и день"""
+        return (self.finance_app.data_version, self.settings_version, datetime.now().date())
+    
+    def show_page(self, index):
+        """Показывает вкладку index. Тяжелую вкладку без актуального кэша сначала заменяет заглушка,
+        а сама страница строится в фоне и подставляется, если пользователь не ушел на другую вкладку"""
+        key = self.page_key()
+        cached = self.page_cache.get(index)
+        if index not in self.BACKGROUND_PAGES or (cached is not None and cached[0] == key):
+            self.main_content.content = self.get_page(index)
+            return
+        
+        self.main_content.content = self.create_page_skeleton()
+        with self.build_lock:
+            # Сборка этой вкладки для той же версии уже идет - она сама подставит результат
+            if self.pending_builds.get(index) == key:
+                return
+            self.pending_builds[index] = key
+        threading.Thread(target=self.build_page_in_background, args=(index, key), daemon=True).start()
+    
+    def build_page_in_background(self, index, key):
+        try:
+            page_content = self.get_page(index)
+        except Exception as ex:
+            page_content = ft.Text(f"Не удалось построить страницу: {ex}", color=ft.Colors.RED)
+        
+        with self.build_lock:
+            if self.pending_builds.get(index) == key:
+                del self.pending_builds[index]
+        
+        # Пока страница строилась, пользователь ушел на другую вкладку - результат остается только в кэше
+        if self.navigation_bar.selected_index != index:
+            return
+        if self.page_key() != key:
+            # Данные изменились во время сборки - строим заново
+            self.show_page(index)
+        else:
+            self.main_content.content = page_content
+        self.page.update()
+    
+    def create_page_skeleton(self):
+        """Легкая заглушка на время фоновой сборки страницы"""
+        def placeholder(height):
+            return ft.Container(height=height, bgcolor=ft.Colors.GREY_200, border_radius=10)
+        
+        return ft.Column([
+            ft.Row([
+                ft.ProgressRing(width=20, height=20, stroke_width=2),
+                ft.Text("Загрузка...", size=16, color=ft.Colors.GREY_600)
+            ], spacing=10),
+            placeholder(120),
+            placeholder(200),
+            placeholder(160)
+        ], spacing=20)
+    
+    def get_page(self, index):
+        """Страница вкладки index: берется из кэша, пока не изменились данные, настройки и день"""
+        key = self.page_key()
+        cached = self.page_cache.get(index)
+        if cached is None or cached[0] != key:
+            # Привязки собираются в поток, который строит страницу: фоновая и обычная сборки не смешиваются
+            self.build_state.bindings = []
+            try:
+                cached = (key, getattr(self, self.PAGE_BUILDERS[index])())
+                self.page_bindings[index] = self.build_state.bindings
+            finally:
+                self.build_state.bindings = None
+            self.page_cache[index] = cached
+        return cached[1]
+    
+    def bind(self, keys, build):
+        """Секция страницы, которая перестраивается только при изменении data[key] для key из keys"""
+        container = ft.Container(content=build())
+        bindings = getattr(self.build_state, "bindings", None)
+        if bindings is not None:
+            bindings.append((frozenset(keys), container, build))
+        return container
+    
+    def invalidate_pages(self):
+        """Сбрасывает кэш страниц после изменений, которые не меняют data_version"""
+        self.settings_version += 1
+    
     def create_home_page(self):
         current_money = self.finance_app.data["current_money"]
         safety_reserve = self.finance_app.data["safety_reserve"]
-        free_money = current_money - safety_reserve
+        free_money = self.get_analytics().free_money
         daily_budget = self.calculate_daily_budget()
-        days_until_salary = self.calculate_days_until_salary(self.finance_app.data["salary_dates"][0])
+        days_until_salary = self.calculate_days_until_salary()
         
         # Получаем данные для текущего месяца
         current_month_income = self.get_current_month_income()
@@ -229,9 +2143,8 @@ class MainApp:
         
         # Получаем информацию о целях
         goals = self.finance_app.data["goals"]
-        goal_investments = self.finance_app.data["goal_investments"]
-        total_goals = sum(goal["amount"] for goal in goals)
-        total_invested = sum(goal_investments.values())
+        total_goals = self.get_analytics().goal_total
+        total_invested = self.get_analytics().goal_invested
         remaining_goals = total_goals - total_invested
         
         # Получаем дни рождения на текущий месяц
@@ -361,6 +2274,7 @@ class MainApp:
                         ft.Text(f"Осталось дней: {days_until_salary}", size=18, weight=ft.FontWeight.BOLD),
                         ft.Text(f"Дневной бюджет: {daily_budget:,.0f} ₽", size=16, color=ft.Colors.GREEN),
                         ft.Text(f"Следующая зарплата: {self.get_next_salary_date_formatted()}", size=14, color=ft.Colors.GREY_600),
+                        self.create_runway_text(),
                         ft.Divider(),
                         ft.Text("📊 Детали:", size=14, weight=ft.FontWeight.BOLD),
                         ft.Text(f"• Всего денег: {current_money:,.0f} ₽", size=12),
@@ -405,7 +2319,7 @@ class MainApp:
                                 shape=ft.RoundedRectangleBorder(radius=8)
                             )
                         ),
-                        self.purchase_analysis
+                        self.create_purchase_analysis_container()
                     ], spacing=15),
                     padding=20
                 )
@@ -469,10 +2383,19 @@ class MainApp:
         self.main_content.content = self.create_analytics_page()
         self.page.update()
     
+    def create_runway_text(self):
+        """Через сколько дней прогнозный остаток опустится ниже резерва"""
+        runway = self.get_analytics().cashflow.runway
+        if runway is None:
+            return ft.Text(f"Денег хватит больше чем на {CASHFLOW_DAYS} дней", size=14, color=ft.Colors.GREEN)
+        return ft.Text(f"Запас до резерва: {runway} дн.", size=14,
+                       color=ft.Colors.RED if runway < 14 else ft.Colors.ORANGE if runway < 60 else ft.Colors.GREEN)
+    
     def create_mini_calendar(self):
         """Создает аккуратный мини-календарь текущего месяца"""
         import calendar
         now = datetime.now()
+        cashflow = self.get_analytics().cashflow
         year = now.year
         month = now.month
         
@@ -519,12 +2442,30 @@ class MainApp:
                 else:
                     is_today = day == now.day
                     is_weekend = week.index(day) >= 5
+                    date = now.date().replace(day=day)
+                    events = cashflow.events_on(date)
+                    
+                    # Подсказка: события дня и прогнозный остаток
+                    tooltip = None
+                    if cashflow.index(date) is not None:
+                        tooltip = "\n".join(
+                            [f"{title}: {amount:+,.0f} ₽" for title, amount in events]
+                            + [f"Остаток: {cashflow.balance_on(date):,.0f} ₽"]
+                        )
                     
                     # Определяем цвета
                     if is_today:
                         color = ft.Colors.WHITE
                         bgcolor = ft.Colors.BLUE_400
                         border_color = ft.Colors.BLUE_600
+                    elif any(amount > 0 for _, amount in events):
+                        color = ft.Colors.GREEN_800
+                        bgcolor = ft.Colors.GREEN_50
+                        border_color = ft.Colors.GREEN_300
+                    elif events:
+                        color = ft.Colors.ORANGE_800
+                        bgcolor = ft.Colors.ORANGE_50
+                        border_color = ft.Colors.ORANGE_300
                     elif is_weekend:
                         color = ft.Colors.RED_600
                         bgcolor = ft.Colors.RED_50
@@ -542,7 +2483,8 @@ class MainApp:
                             bgcolor=bgcolor,
                             border=ft.border.all(1, border_color),
                             border_radius=4,
-                            alignment=ft.alignment.center
+                            alignment=ft.alignment.center,
+                            tooltip=tooltip
                         )
                     )
             day_rows.append(week_row)
@@ -592,15 +2534,8 @@ class MainApp:
     
     def get_current_month_birthdays(self):
         """Получает дни рождения текущего месяца"""
-        now = datetime.now()
-        current_month = now.month
-        
-        birthdays = []
-        for birthday in self.finance_app.data["birthdays"]:
-            if self.convert_month_to_int(birthday["month"]) == current_month:
-                birthdays.append(birthday["name"])
-        
-        return birthdays
+        current_month = datetime.now().month
+        return [birthday["name"] for birthday in self.get_analytics().birthdays_in_month(current_month)]
     
     def convert_month_to_int(self, month_name):
         """Конвертирует название месяца в число"""
@@ -611,43 +2546,15 @@ class MainApp:
         }
         return months.get(month_name, 1)
     
-    def calculate_days_until_salary(self, salary_date):
-        """Рассчитывает дни до следующей зарплаты"""
-        now = datetime.now()
-        current_month = now.month
-        current_year = now.year
-        
-        # Следующая зарплата
-        if now.day <= salary_date:
-            next_salary = datetime(current_year, current_month, salary_date)
-        else:
-            if current_month == 12:
-                next_salary = datetime(current_year + 1, 1, salary_date)
-            else:
-                next_salary = datetime(current_year, current_month + 1, salary_date)
-        
-        # Используем только даты без времени для точного расчета
-        today = now.date()
-        salary_day = next_salary.date()
-        delta = salary_day - today
-        return max(0, delta.days)
+    def calculate_days_until_salary(self):
+        """Рассчитывает дни до ближайшей зарплаты (по календарю движения денег)"""
+        days = self.get_analytics().cashflow.days_until_salary()
+        return days if days is not None else 0
     
     def get_next_salary_date_formatted(self):
         """Получает дату следующей зарплаты в формате строки"""
-        salary_date = self.finance_app.data["salary_dates"][0]
-        now = datetime.now()
-        current_month = now.month
-        current_year = now.year
-        
-        if now.day <= salary_date:
-            next_salary = datetime(current_year, current_month, salary_date)
-        else:
-            if current_month == 12:
-                next_salary = datetime(current_year + 1, 1, salary_date)
-            else:
-                next_salary = datetime(current_year, current_month + 1, salary_date)
-        
-        return next_salary.strftime("%d.%m.%Y")
+        next_salary = self.get_analytics().cashflow.next_salary_date()
+        return next_salary.strftime("%d.%m.%Y") if next_salary else "—"
     
     def calculate_current_month_expenses(self):
         """Рассчитывает расходы текущего месяца"""
@@ -673,24 +2580,24 @@ class MainApp:
             padding=10
         )
     
-    def create_simple_purchase_analysis(self):
+    def create_simple_purchase_analysis(self, price=None, product_name=None):
         """Создает максимально подробный анализ покупки с детальной информацией"""
         current_money = self.finance_app.data["current_money"]
         safety_reserve = self.finance_app.data["safety_reserve"]
-        free_money = current_money - safety_reserve
-        price = getattr(self, 'purchase_price', 0)
-        product_name = getattr(self, 'purchase_name', 'Товар')
+        free_money = self.get_analytics().free_money
+        if price is None:
+            price = getattr(self, 'purchase_price', 0)
+        if product_name is None:
+            product_name = getattr(self, 'purchase_name', 'Товар')
         
         # Получаем дополнительную информацию
         goals = self.finance_app.data["goals"]
-        goal_investments = self.finance_app.data["goal_investments"]
-        total_goals = sum(goal["amount"] for goal in goals)
-        total_invested = sum(goal_investments.values())
+        total_goals = self.get_analytics().goal_total
+        total_invested = self.get_analytics().goal_invested
         remaining_goals = total_goals - total_invested
         
         # Рассчитываем месячные накопления
-        rent_cost = self.finance_app.data.get("rent_cost", 25000)
-        monthly_savings = self.finance_app.data["salary"] - self.calculate_average_monthly_expenses() - (3000 if self.finance_app.data["chatgpt_enabled"] else 0) - rent_cost
+        monthly_savings = self.get_analytics().planned_monthly_savings
         
         # Анализ возможности покупки
         can_buy_now = free_money >= price
@@ -891,22 +2798,40 @@ class MainApp:
         
         return ft.Column(analysis, spacing=10)
     
+    def get_measured_seasonality(self):
+        """Сезонная модель, если накоплено достаточно закрытых месяцев, иначе None"""
+        seasonal = self.finance_app.get_seasonal_model()
+        return seasonal if seasonal.months_observed >= SEASONALITY_MIN_MONTHS else None
+    
+    def describe_seasonal_month(self, seasonal, month):
+        """Причина для месяца по измеренному сезонному индексу расходов"""
+        change = (seasonal.index()[month - 1] - 1) * 100
+        if change <= -5:
+            return f"Расходы обычно на {-change:.0f}% ниже среднего"
+        if change < 5:
+            return "Расходы на уровне среднего"
+        reason = f"Расходы обычно на {change:.0f}% выше среднего"
+        peaks = seasonal.top_categories(month)
+        if peaks:
+            reason += f" ({', '.join(str(category or 'Прочее') for category in peaks)})"
+        return reason
+    
     def get_best_months_for_purchase(self, price=None):
         """Возвращает лучшие месяцы для покупки с причинами"""
-        months_analysis = {
-            1: {"name": "Январь", "good": True, "reason": "Нет праздников, стабильные расходы"},
-            2: {"name": "Февраль", "good": True, "reason": "День Святого Валентина, но небольшие траты"},
-            3: {"name": "Март", "good": True, "reason": "8 Марта, но умеренные расходы"},
-            4: {"name": "Апрель", "good": True, "reason": "Нет крупных праздников"},
-            5: {"name": "Май", "good": True, "reason": "Майские праздники, но много выходных"},
-            6: {"name": "Июнь", "good": True, "reason": "Начало лета, стабильные расходы"},
-            7: {"name": "Июль", "good": True, "reason": "Середина лета, отпуска"},
-            8: {"name": "Август", "good": True, "reason": "Конец лета, подготовка к осени"},
-            9: {"name": "Сентябрь", "good": True, "reason": "Начало учебного года, стабильность"},
-            10: {"name": "Октябрь", "good": True, "reason": "Осень, умеренные расходы"},
-            11: {"name": "Ноябрь", "good": True, "reason": "Подготовка к зиме, стабильность"},
-            12: {"name": "Декабрь", "good": False, "reason": "Новый год - много трат"}
-        }
+        seasonal = self.get_measured_seasonality()
+        if seasonal is not None:
+            # Есть история - месяцы оцениваются по измеренной сезонности расходов
+            index = seasonal.index()
+            months_analysis = {
+                month: {
+                    "name": self.get_month_name(month),
+                    "good": index[month - 1] <= 1.1,
+                    "reason": self.describe_seasonal_month(seasonal, month)
+                }
+                for month in range(1, 13)
+            }
+        else:
+            months_analysis = self.get_default_purchase_months()
         
         # Добавляем дни рождения
         birthdays = self.finance_app.data["birthdays"]
@@ -923,29 +2848,45 @@ class MainApp:
                 good_months.append({
                     "month": data["name"],
                     "reason": data["reason"],
-                    "priority": self.get_month_priority(month_num)
+                    "priority": -index[month_num - 1] if seasonal is not None else self.get_month_priority(month_num)
                 })
         
         # Сортируем по приоритету (чем выше, тем лучше)
         good_months.sort(key=lambda x: x["priority"], reverse=True)
         return good_months
     
+    def get_default_purchase_months(self):
+        """Оценка месяцев по праздникам, пока нет истории расходов"""
+        return {
+            1: {"name": "Январь", "good": True, "reason": "Нет праздников, стабильные расходы"},
+            2: {"name": "Февраль", "good": True, "reason": "День Святого Валентина, но небольшие траты"},
+            3: {"name": "Март", "good": True, "reason": "8 Марта, но умеренные расходы"},
+            4: {"name": "Апрель", "good": True, "reason": "Нет крупных праздников"},
+            5: {"name": "Май", "good": True, "reason": "Майские праздники, но много выходных"},
+            6: {"name": "Июнь", "good": True, "reason": "Начало лета, стабильные расходы"},
+            7: {"name": "Июль", "good": True, "reason": "Середина лета, отпуска"},
+            8: {"name": "Август", "good": True, "reason": "Конец лета, подготовка к осени"},
+            9: {"name": "Сентябрь", "good": True, "reason": "Начало учебного года, стабильность"},
+            10: {"name": "Октябрь", "good": True, "reason": "Осень, умеренные расходы"},
+            11: {"name": "Ноябрь", "good": True, "reason": "Подготовка к зиме, стабильность"},
+            12: {"name": "Декабрь", "good": False, "reason": "Новый год - много трат"}
+        }
+    
     def get_worst_months_for_purchase(self, price=None):
         """Возвращает худшие месяцы для покупки с причинами"""
-        months_analysis = {
-            1: {"name": "Январь", "bad": False, "reason": ""},
-            2: {"name": "Февраль", "bad": False, "reason": ""},
-            3: {"name": "Март", "bad": False, "reason": ""},
-            4: {"name": "Апрель", "bad": False, "reason": ""},
-            5: {"name": "Май", "bad": False, "reason": ""},
-            6: {"name": "Июнь", "bad": False, "reason": ""},
-            7: {"name": "Июль", "bad": False, "reason": ""},
-            8: {"name": "Август", "bad": False, "reason": ""},
-            9: {"name": "Сентябрь", "bad": False, "reason": ""},
-            10: {"name": "Октябрь", "bad": False, "reason": ""},
-            11: {"name": "Ноябрь", "bad": False, "reason": ""},
-            12: {"name": "Декабрь", "bad": True, "reason": "Новый год - много трат на подарки"}
-        }
+        seasonal = self.get_measured_seasonality()
+        if seasonal is not None:
+            index = seasonal.index()
+            months_analysis = {
+                month: {
+                    "name": self.get_month_name(month),
+                    "bad": index[month - 1] > 1.1,
+                    "reason": self.describe_seasonal_month(seasonal, month)
+                }
+                for month in range(1, 13)
+            }
+        else:
+            months_analysis = self.get_default_bad_months()
         
         # Добавляем дни рождения
         birthdays = self.finance_app.data["birthdays"]
@@ -962,13 +2903,30 @@ class MainApp:
                 bad_months.append({
                     "month": data["name"],
                     "reason": data["reason"],
-                    "priority": self.get_month_bad_priority(month_num)
+                    "priority": index[month_num - 1] if seasonal is not None else self.get_month_bad_priority(month_num)
                 })
         
         # Сортируем по приоритету (чем выше, тем хуже)
         bad_months.sort(key=lambda x: x["priority"], reverse=True)
         return bad_months
     
+    def get_default_bad_months(self):
+        """Худшие месяцы по праздникам, пока нет истории расходов"""
+        return {
+            1: {"name": "Январь", "bad": False, "reason": ""},
+            2: {"name": "Февраль", "bad": False, "reason": ""},
+            3: {"name": "Март", "bad": False, "reason": ""},
+            4: {"name": "Апрель", "bad": False, "reason": ""},
+            5: {"name": "Май", "bad": False, "reason": ""},
+            6: {"name": "Июнь", "bad": False, "reason": ""},
+            7: {"name": "Июль", "bad": False, "reason": ""},
+            8: {"name": "Август", "bad": False, "reason": ""},
+            9: {"name": "Сентябрь", "bad": False, "reason": ""},
+            10: {"name": "Октябрь", "bad": False, "reason": ""},
+            11: {"name": "Ноябрь", "bad": False, "reason": ""},
+            12: {"name": "Декабрь", "bad": True, "reason": "Новый год - много трат на подарки"}
+        }
+    
     def get_best_months_for_saving(self):
         """Возвращает лучшие месяцы для накопления с причинами"""
         best_purchase = self.get_best_months_for_purchase()
@@ -1111,7 +3069,7 @@ class MainApp:
                             on_change=self.update_safety_reserve
                         ),
                         ft.Text("Минимальная сумма, которая всегда должна оставаться на счету", size=12, color=ft.Colors.GREY_600),
-                        self.create_reserve_status()
+                        self.bind(["current_money", "safety_reserve"], self.create_reserve_status)
                     ], spacing=10),
                     padding=20
                 )
@@ -1218,7 +3176,7 @@ class MainApp:
                 content=ft.Container(
                     content=ft.Column([
                         ft.Text("Мои цели", size=18, weight=ft.FontWeight.BOLD),
-                        self.create_goals_list()
+                        self.bind(["goals", "goal_investments"], self.create_goals_list)
                     ], spacing=10),
                     padding=20
                 )
@@ -1380,27 +3338,27 @@ class MainApp:
             self.purchase_analysis_container.content = self.create_purchase_analysis()
             self.page.update()
     
-    def refresh_all_pages(self):
-        """Обновляет все страницы с актуальными данными"""
-        # Обновляем текущую страницу
+    def refresh_all_pages(self, *keys):
+        """Обновляет текущую страницу после изменения данных.
+        
+        Если переданы измененные ключи данных и страница построена из привязанных секций,
+        перестраиваются только секции, подписанные на эти ключи; иначе страница строится заново.
+        """
+        self.invalidate_pages()
+        
+        # Обновляем текущую страницу (настройки не перестраиваем, чтобы не сбить ввод)
         if hasattr(self, 'main_content') and self.main_content.content:
             # Получаем текущий индекс из навигационной панели
             current_page = self.navigation_bar.selected_index if hasattr(self, 'navigation_bar') else 0
+            bindings = self.page_bindings.get(current_page)
             
-            if current_page == 0:  # Главная
-                self.main_content.content = self.create_home_page()
-            elif current_page == 1:  # Деньги
-                self.main_content.content = self.create_money_page()
-            elif current_page == 2:  # Цели
-                self.main_content.content = self.create_goals_page()
-            elif current_page == 3:  # Аналитика
-                self.main_content.content = self.create_analytics_page()
-            elif current_page == 4:  # Прогноз
-                self.main_content.content = self.create_forecast_page()
-            elif current_page == 5:  # Калькулятор
-                self.main_content.content = self.create_calculator_page()
-            elif current_page == 6:  # Заметки
-                self.main_content.content = self.create_notes_page()
+            if keys and bindings:
+                changed = set(keys)
+                for binding_keys, container, build in bindings:
+                    if binding_keys & changed:
+                        container.content = build()
+            elif current_page is not None and 0 <= current_page < len(self.PAGE_BUILDERS) - 1:
+                self.show_page(current_page)
         
         self.page.update()
     
@@ -1413,7 +3371,7 @@ class MainApp:
         
         current_money = self.finance_app.data["current_money"]
         safety_reserve = self.finance_app.data["safety_reserve"]
-        free_money = current_money - safety_reserve
+        free_money = self.get_analytics().free_money
         
         # Получаем информацию о квартплате
         rent_paid_until = self.finance_app.data.get("rent_paid_until", "")
@@ -1552,16 +3510,15 @@ class MainApp:
             holidays.append("8 Марта")
         return holidays
     
-    def get_birthdays_for_month(self, month):
-        birthdays = []
-        for birthday in self.finance_app.data["birthdays"]:
-            if self.convert_month_to_int(birthday["month"]) == month:
-                birthdays.append({
-                    "name": birthday["name"],
-                    "relationship": birthday["relationship"],
-                    "gift_cost": birthday.get("gift_cost", 2000)
-                })
-        return birthdays
+    def get_birthdays_for_month(self, month):
+        return [
+            {
+                "name": birthday["name"],
+                "relationship": birthday["relationship"],
+                "gift_cost": birthday.get("gift_cost", 2000)
+            }
+            for birthday in self.get_analytics().birthdays_in_month(month)
+        ]
     
     def get_months_analysis(self):
         """Анализ месяцев с учетом праздников и дней рождения"""
@@ -1580,20 +3537,33 @@ class MainApp:
             12: {"name": "Декабрь", "good": True, "cost": 0, "reason": ""}
         }
         
-        # Добавляем праздники
-        holiday_months = {
-            2: 3000,  # День святого Валентина
-            3: 5000,  # 8 Марта
-            5: 2000,  # День Победы
-            6: 2000,  # День России
-            11: 2000, # День народного единства
-            12: 15000 # Новый год
-        }
-        
-        for month, cost in holiday_months.items():
-            months_analysis[month]["cost"] = cost
-            months_analysis[month]["good"] = False
-            months_analysis[month]["reason"] = "Праздник"
+        seasonal = self.get_measured_seasonality()
+        if seasonal is not None:
+            # Доп. расходы месяца - насколько он в среднем дороже обычного
+            averages = seasonal.monthly_averages()
+            observed = [value for value in averages if value is not None]
+            overall = sum(observed) / len(observed)
+            for month, average in enumerate(averages, 1):
+                extra = max(0, (average or 0) - overall)
+                if extra > 0:
+                    months_analysis[month]["cost"] = round(extra)
+                    months_analysis[month]["good"] = extra < 5000
+                    months_analysis[month]["reason"] = "Сезонный рост расходов"
+        else:
+            # Добавляем праздники
+            holiday_months = {
+                2: 3000,  # День святого Валентина
+                3: 5000,  # 8 Марта
+                5: 2000,  # День Победы
+                6: 2000,  # День России
+                11: 2000, # День народного единства
+                12: 15000 # Новый год
+            }
+            
+            for month, cost in holiday_months.items():
+                months_analysis[month]["cost"] = cost
+                months_analysis[month]["good"] = False
+                months_analysis[month]["reason"] = "Праздник"
         
         # Добавляем дни рождения
         for birthday in self.finance_app.data["birthdays"]:
@@ -1720,7 +3690,10 @@ class MainApp:
                     "icon": "📦"
                 })
                 self.finance_app.save_data()
-                self.refresh_all_pages()
+                # Новая категория нужна и в фильтре истории, который не перестраивается
+                if hasattr(self, 'history_category_filter'):
+                    self.history_category_filter.options = self.history_category_options()
+                self.refresh_all_pages("custom_categories")
                 
                 # Очищаем поле
                 self.new_category_field.value = ""
@@ -1763,9 +3736,8 @@ class MainApp:
         current_month_income = self.get_current_month_income()
         
         # Анализ текущей ситуации
-        free_money = current_money - safety_reserve
-        rent_cost = self.finance_app.data.get("rent_cost", 25000)
-        monthly_savings = salary - self.calculate_average_monthly_expenses() - (3000 if self.finance_app.data["chatgpt_enabled"] else 0) - rent_cost
+        free_money = self.get_analytics().free_money
+        monthly_savings = self.get_analytics().planned_monthly_savings
         
         # Определяем статус
         if free_money < 0:
@@ -1836,7 +3808,6 @@ class MainApp:
         ], spacing=5)
     
     def create_savings_strategy(self):
-        current_money = self.finance_app.data["current_money"]
         salary = self.finance_app.data["salary"]
         safety_reserve = self.finance_app.data["safety_reserve"]
         monthly_expenses = self.calculate_average_monthly_expenses()
@@ -1872,7 +3843,7 @@ class MainApp:
         else:
             # Для текущего месяца используем rent_for_current_month, для будущих - всегда rent_cost
             monthly_savings = salary - monthly_expenses - chatgpt_cost - rent_cost
-        free_money = current_money - safety_reserve
+        free_money = self.get_analytics().free_money
         
         # Анализируем месяцы с учетом праздников и ДР
         months_analysis = {
@@ -2072,8 +4043,7 @@ class MainApp:
     def create_critical_warnings(self):
         current_money = self.finance_app.data["current_money"]
         safety_reserve = self.finance_app.data["safety_reserve"]
-        rent_cost = self.finance_app.data.get("rent_cost", 25000)
-        monthly_savings = self.finance_app.data["salary"] - self.calculate_average_monthly_expenses() - (3000 if self.finance_app.data["chatgpt_enabled"] else 0) - rent_cost
+        monthly_savings = self.get_analytics().planned_monthly_savings
         
         warnings = []
         
@@ -2123,15 +4093,8 @@ class MainApp:
         avg_monthly_expenses = self.calculate_average_monthly_expenses()
         
         # Анализ категорий трат
-        transactions = self.finance_app.data["transactions"]
         current_month = datetime.now().strftime("%Y-%m")
-        
-        categories = {}
-        for transaction in transactions:
-            if transaction["type"] == "expense" and transaction["date"].startswith(current_month):
-                category = transaction.get("category", "other")
-                amount = transaction["amount"]
-                categories[category] = categories.get(category, 0) + amount
+        categories = self.finance_app.get_aggregates().category_totals(current_month, "expense")
         
         # Сортируем по убыванию
         sorted_categories = sorted(categories.items(), key=lambda x: x[1], reverse=True)
@@ -2213,8 +4176,7 @@ class MainApp:
     def create_goals_analysis(self):
         goals = self.finance_app.data["goals"]
         goal_investments = self.finance_app.data["goal_investments"]
-        rent_cost = self.finance_app.data.get("rent_cost", 25000)
-        monthly_savings = self.finance_app.data["salary"] - self.calculate_average_monthly_expenses() - (3000 if self.finance_app.data["chatgpt_enabled"] else 0) - rent_cost
+        monthly_savings = self.get_analytics().planned_monthly_savings
         
         if not goals:
             return ft.Column([
@@ -2260,13 +4222,11 @@ class MainApp:
         current_month = datetime.now().month
         months_analysis = self.get_months_analysis()
         goals = self.finance_app.data["goals"]
-        goal_investments = self.finance_app.data["goal_investments"]
-        rent_cost = self.finance_app.data.get("rent_cost", 25000)
-        monthly_savings = self.finance_app.data["salary"] - self.calculate_average_monthly_expenses() - (3000 if self.finance_app.data["chatgpt_enabled"] else 0) - rent_cost
+        monthly_savings = self.get_analytics().planned_monthly_savings
         
         # Рассчитываем общую сумму целей
-        total_goals = sum(goal["amount"] for goal in goals)
-        total_invested = sum(goal_investments.values())
+        total_goals = self.get_analytics().goal_total
+        total_invested = self.get_analytics().goal_invested
         remaining_goals = total_goals - total_invested
         
         # Создаем заголовок таблицы
@@ -2448,8 +4408,7 @@ class MainApp:
     def create_action_plan(self):
         current_money = self.finance_app.data["current_money"]
         safety_reserve = self.finance_app.data["safety_reserve"]
-        rent_cost = self.finance_app.data.get("rent_cost", 25000)
-        monthly_savings = self.finance_app.data["salary"] - self.calculate_average_monthly_expenses() - (3000 if self.finance_app.data["chatgpt_enabled"] else 0) - rent_cost
+        monthly_savings = self.get_analytics().planned_monthly_savings
         
         actions = []
         
@@ -2483,27 +4442,14 @@ class MainApp:
         ], spacing=8)
     
     def get_next_salary_date(self):
-        today = datetime.now()
-        current_day = today.day
-        salary_dates = self.finance_app.data["salary_dates"]
-        
-        # Находим следующую дату зарплаты
-        for salary_day in sorted(salary_dates):
-            if current_day <= salary_day:
-                return today.replace(day=salary_day)
-        
-        # Если все даты прошли, берем первую дату следующего месяца
-        next_month = today.replace(month=today.month + 1, day=1) if today.month < 12 else today.replace(year=today.year + 1, month=1, day=1)
-        return next_month.replace(day=min(salary_dates))
+        next_salary = self.get_analytics().cashflow.next_salary_date()
+        return datetime.combine(next_salary, datetime.min.time()) if next_salary else None
     
     def calculate_daily_budget(self):
         """Рассчитывает правильный дневной бюджет с учетом резерва"""
-        current_money = self.finance_app.data["current_money"]
-        safety_reserve = self.finance_app.data["safety_reserve"]
-        free_money = current_money - safety_reserve
+        free_money = self.get_analytics().free_money
         
-        salary_date = self.finance_app.data["salary_dates"][0]
-        days_until_salary = self.calculate_days_until_salary(salary_date)
+        days_until_salary = self.calculate_days_until_salary()
         
         if days_until_salary <= 0 or free_money <= 0:
             return 0
@@ -2526,7 +4472,8 @@ class MainApp:
         try:
             self.finance_app.data["current_money"] = float(e.control.value)
             self.finance_app.save_data()
-            # Не обновляем страницу сразу, чтобы не сбрасывать фокус
+            # Поле ввода не перестраиваем (чтобы не сбрасывать фокус) - только привязанные секции
+            self.refresh_all_pages("current_money")
         except ValueError:
             pass
     
@@ -2576,19 +4523,16 @@ class MainApp:
         try:
             self.finance_app.data["safety_reserve"] = float(e.control.value)
             self.finance_app.save_data()
-            self.refresh_all_pages()
+            self.refresh_all_pages("safety_reserve")
         except ValueError:
             pass
     
     def toggle_chatgpt(self, e):
         self.finance_app.data["chatgpt_enabled"] = e.control.value
         self.finance_app.save_data()
-        self.refresh_all_pages()
+        self.refresh_all_pages("chatgpt_enabled")
     
     def create_birthdays_management(self):
-        birthdays = self.finance_app.data["birthdays"]
-        salary = self.finance_app.data["salary"]
-        
         # Поля для добавления нового ДР
         self.birthday_name = ft.TextField(label="Имя", width=150)
         self.birthday_month = ft.Dropdown(
@@ -2620,6 +4564,7 @@ class MainApp:
         
         # Умный расчет стоимости подарка с учетом месяца и финансов
         def calculate_gift_cost(relationship, month):
+            salary = self.finance_app.data["salary"]
             # Базовые проценты от дохода
             base_percentages = {
                 "Девушка": 0.12,  # 12% - самый важный человек
@@ -2725,10 +4670,8 @@ class MainApp:
             ft.Divider(),
             
             ft.Text("Список дней рождения:", size=14, weight=ft.FontWeight.BOLD),
-                *[ft.Row([
-                    ft.Text(f"🎂 {birthday['name']} - {['', 'Январь', 'Февраль', 'Март', 'Апрель', 'Май', 'Июнь', 'Июль', 'Август', 'Сентябрь', 'Октябрь', 'Ноябрь', 'Декабрь'][self.convert_month_to_int(birthday['month'])]} - {birthday['cost']:,.0f} ₽", size=12),
-                    ft.IconButton(ft.Icons.DELETE, on_click=lambda e, idx=i: self.delete_birthday(idx))
-                ]) for i, birthday in enumerate(birthdays)],
+            # Форма выше не перестраивается: при изменении дней рождения обновляется только список
+            self.bind(["birthdays"], self.create_birthdays_list),
             
             ft.Divider(),
             
@@ -2762,6 +4705,15 @@ class MainApp:
                 ft.Text("• Друг в июле: 1,600 ₽ (хороший)", size=11)
         ], spacing=10)
     
+    def create_birthdays_list(self):
+        birthdays = self.finance_app.data["birthdays"]
+        return ft.Column([
+            ft.Row([
+                ft.Text(f"🎂 {birthday['name']} - {['', 'Январь', 'Февраль', 'Март', 'Апрель', 'Май', 'Июнь', 'Июль', 'Август', 'Сентябрь', 'Октябрь', 'Ноябрь', 'Декабрь'][self.convert_month_to_int(birthday['month'])]} - {birthday['cost']:,.0f} ₽", size=12),
+                ft.IconButton(ft.Icons.DELETE, on_click=lambda e, idx=i: self.delete_birthday(idx))
+            ]) for i, birthday in enumerate(birthdays)
+        ], spacing=10)
+    
     def add_birthday(self, e):
         name = self.birthday_name.value
         month = self.birthday_month.value
@@ -2847,13 +4799,13 @@ class MainApp:
             self.birthday_relationship.value = None
             self.birthday_cost_display.value = ""
             
-            self.refresh_all_pages()
+            self.refresh_all_pages("birthdays")
     
     def delete_birthday(self, idx):
         if 0 <= idx < len(self.finance_app.data["birthdays"]):
             del self.finance_app.data["birthdays"][idx]
             self.finance_app.save_data()
-            self.refresh_all_pages()
+            self.refresh_all_pages("birthdays")
     
     def create_reserve_status(self):
         current_money = self.finance_app.data["current_money"]
@@ -2896,12 +4848,11 @@ class MainApp:
         transaction = {
             "type": "expense",
             "amount": rent_amount,
-            "description": "Оплата квартплаты",
+            "description": RENT_PAYMENT_DESCRIPTION,
             "date": datetime.now().strftime("%Y-%m-%d %H:%M")
         }
         
-        self.finance_app.data["transactions"].append(transaction)
-        self.finance_app.save_data()
+        self.finance_app.add_transaction(transaction)
         self.page.update()
     
     def reset_rent(self, e):
@@ -2956,45 +4907,138 @@ class MainApp:
             return ft.Text("Неверный формат даты", size=12, color=ft.Colors.RED)
     
     def check_rent_due(self):
-        rent_paid_until = self.finance_app.data["rent_paid_until"]
-        if not rent_paid_until:
-            return False
-        
-        try:
-            paid_until_date = datetime.strptime(rent_paid_until, "%Y-%m-%d").date()
-            today = datetime.date.today()
-            return today >= paid_until_date
-        except:
-            return False
+        return self.get_analytics().cashflow.rent_due
+    
+    def history_category_options(self):
+        category_options = [ft.dropdown.Option("Все категории", "")]
+        for category in ["food", "restaurants", "games", "transport", "clothing", "electronics", "entertainment", "other"]:
+            category_options.append(ft.dropdown.Option(self.get_category_name(category), category))
+        for cat in self.finance_app.data.get("custom_categories", []):
+            category_options.append(ft.dropdown.Option(f"{cat['icon']} {cat['name']}", cat['key']))
+        return category_options
     
     def create_transactions_list(self):
-        transactions = self.finance_app.data["transactions"]
+        """История транзакций: фильтры и постраничный список.
         
-        if not transactions:
-            return ft.Text("Нет транзакций")
+        Фильтры строятся один раз, чтобы не сбивать ввод; при изменении транзакций
+        перестраивается только список (контейнер history_container).
+        """
+        history = self.transaction_history
+        self.history_category_filter = ft.Dropdown(
+            label="Категория",
+            width=180,
+            value=history.category or "",
+            options=self.history_category_options(),
+            on_change=lambda e: self.update_history_filter(category=e.control.value)
+        )
+        self.history_container = self.bind(["transactions", "custom_categories"], self.create_history_page)
         
-        transaction_widgets = []
-        for transaction in reversed(transactions[-10:]):
-            if transaction["type"] == "income":
-                color = ft.Colors.GREEN
-                icon = ft.Icons.ADD
-            elif transaction["type"] == "goal_investment":
-                color = ft.Colors.BLUE
-                icon = ft.Icons.SAVINGS
-            else:
-                color = ft.Colors.RED
-                icon = ft.Icons.REMOVE
-            
-            transaction_widgets.append(
-                ft.ListTile(
-                    leading=ft.Icon(icon, color=color),
-                    title=ft.Text(transaction["description"]),
-                    subtitle=ft.Text(transaction["date"]),
-                    trailing=ft.Text(f"{transaction['amount']:,.0f} ₽", color=color, weight=ft.FontWeight.BOLD)
+        return ft.Column([
+            ft.Row([
+                ft.Dropdown(
+                    label="Тип",
+                    width=150,
+                    value=history.transaction_type or "",
+                    options=[
+                        ft.dropdown.Option("Все", ""),
+                        ft.dropdown.Option("Доходы", "income"),
+                        ft.dropdown.Option("Расходы", "expense"),
+                        ft.dropdown.Option("В цели", "goal_investment")
+                    ],
+                    on_change=lambda e: self.update_history_filter(transaction_type=e.control.value)
+                ),
+                self.history_category_filter,
+                ft.TextField(
+                    label="С (YYYY-MM-DD)",
+                    width=150,
+                    value=history.start or "",
+                    on_change=lambda e: self.update_history_date("start", e.control)
+                ),
+                ft.TextField(
+                    label="По (YYYY-MM-DD)",
+                    width=150,
+                    value=history.end or "",
+                    on_change=lambda e: self.update_history_date("end", e.control)
                 )
+            ], wrap=True, spacing=10),
+            self.history_container
+        ], spacing=10)
+    
+    def create_history_page(self):
+        if not self.finance_app.data["transactions"]:
+            return ft.Text("Нет транзакций")
+        
+        history = self.transaction_history
+        transactions, has_next = history.page()
+        
+        if transactions:
+            # ListView рисует только видимые строки, а на странице их не больше HISTORY_PAGE_SIZE
+            history_list = ft.ListView(
+                controls=[self.create_transaction_tile(t.source) for t in transactions],
+                item_extent=72,
+                height=400
             )
+        else:
+            history_list = ft.Text("Нет транзакций по выбранным фильтрам", color=ft.Colors.GREY_600)
         
-        return ft.Column(transaction_widgets)
+        return ft.Column([
+            history_list,
+            ft.Row([
+                ft.IconButton(ft.Icons.CHEVRON_LEFT, on_click=self.show_previous_history_page, disabled=history.page_number == 0),
+                ft.Text(f"Страница {history.page_number + 1}", size=14),
+                ft.IconButton(ft.Icons.CHEVRON_RIGHT, on_click=self.show_next_history_page, disabled=not has_next)
+            ], alignment=ft.MainAxisAlignment.CENTER)
+        ], spacing=10)
+    
+    def create_transaction_tile(self, transaction):
+        if transaction["type"] == "income":
+            color = ft.Colors.GREEN
+            icon = ft.Icons.ADD
+        elif transaction["type"] == "goal_investment":
+            color = ft.Colors.BLUE
+            icon = ft.Icons.SAVINGS
+        else:
+            color = ft.Colors.RED
+            icon = ft.Icons.REMOVE
+        
+        subtitle = transaction["date"]
+        if transaction.get("category"):
+            subtitle += f" • {self.get_category_name(transaction['category'])}"
+        
+        return ft.ListTile(
+            leading=ft.Icon(icon, color=color),
+            title=ft.Text(transaction["description"]),
+            subtitle=ft.Text(subtitle),
+            trailing=ft.Text(f"{transaction['amount']:,.0f} ₽", color=color, weight=ft.FontWeight.BOLD)
+        )
+    
+    def refresh_history(self):
+        if hasattr(self, 'history_container'):
+            self.history_container.content = self.create_history_page()
+            self.page.update()
+    
+    def update_history_filter(self, **filters):
+        self.transaction_history.set_filter(**filters)
+        self.refresh_history()
+    
+    def update_history_date(self, field, control):
+        # Неполная или неверная дата снимает границу (до исправления) и подсвечивает поле
+        value = (control.value or "").strip()
+        valid = not value or (len(value) == 10 and parse_transaction_date(value) is not None)
+        control.error_text = None if valid else "Дата в формате YYYY-MM-DD"
+        bound = value if valid else None
+        if (bound or None) == getattr(self.transaction_history, field):
+            self.page.update()
+            return
+        self.update_history_filter(**{field: bound})
+    
+    def show_previous_history_page(self, e):
+        self.transaction_history.previous_page()
+        self.refresh_history()
+    
+    def show_next_history_page(self, e):
+        self.transaction_history.next_page()
+        self.refresh_history()
     
     def create_goals_list(self):
         goals = self.finance_app.data["goals"]
@@ -3081,7 +5125,7 @@ class MainApp:
             del self.finance_app.data["goal_investments"][goal_name]
         
         self.finance_app.save_data()
-        self.refresh_all_pages()
+        self.refresh_all_pages("goals", "goal_investments")
         self.page.update()
         print(f"DEBUG: Цель '{goal_name}' удалена")
     
@@ -3159,8 +5203,8 @@ class MainApp:
         current_emergency = current_money - sum(goal_investments.values()) - rent_to_pay
         
         # Анализ целей
-        total_goal_amount = sum(goal["amount"] for goal in goals)
-        total_invested = sum(goal_investments.values())
+        total_goal_amount = self.get_analytics().goal_total
+        total_invested = self.get_analytics().goal_invested
         remaining_goals = total_goal_amount - total_invested
         
         # Умные рекомендации
@@ -3257,31 +5301,40 @@ class MainApp:
             remaining_goals = total_goal_amount - total_invested
             
             if remaining_goals > 0:
-                # Расчет приоритетов целей
-                goal_priorities = self.calculate_goal_priorities(goals, goal_investments)
-                
+                # План взносов: на цели идет прогнозируемый остаток после расходов и квартплаты
+                monthly_budget = max(0, self.get_analytics().planned_monthly_savings)
+                goal_priorities = self.calculate_goal_priorities(goals, goal_investments, monthly_budget)
+            else:
+                goal_priorities = []
+            
+            if goal_priorities:
+                first = goal_priorities[0]
                 recommendations.append({
                     "title": "🎯 Стратегия по целям",
                     "description": f"Осталось накопить {remaining_goals:,.0f} ₽ на {len(goals)} целей",
-                    "action": f"Приоритет: {goal_priorities[0]['name']} - {goal_priorities[0]['monthly_needed']:,.0f} ₽/мес"
+                    "action": f"Приоритет: {first['name']} - {first['schedule'][0]:,.0f} ₽ в этом месяце"
                 })
                 
                 # Рекомендация по распределению дохода
-                total_monthly_needed = sum(g["monthly_needed"] for g in goal_priorities)
-                max_affordable = monthly_income * 0.25  # Максимум 25% от дохода на цели
-                
-                if total_monthly_needed > max_affordable:
+                late_goals = [g for g in goal_priorities if not g["on_time"]]
+                if late_goals:
                     recommendations.append({
                         "title": "💡 Оптимизация целей",
-                        "description": f"Нужно {total_monthly_needed:,.0f} ₽/мес, но это {total_monthly_needed/monthly_income*100:.0f}% дохода",
-                        "action": f"Реально откладывать только {max_affordable:,.0f} ₽/мес. Рассмотрите увеличение сроков целей"
+                        "description": f"При {monthly_budget:,.0f} ₽/мес к сроку не успеть: {', '.join(g['name'] for g in late_goals)}",
+                        "action": f"Не хватит {sum(g['shortfall'] for g in late_goals):,.0f} ₽. Рассмотрите увеличение сроков целей"
                     })
                 else:
                     recommendations.append({
                         "title": "✅ Цели достижимы",
-                        "description": f"Нужно {total_monthly_needed:,.0f} ₽/мес ({total_monthly_needed/monthly_income*100:.0f}% дохода)",
+                        "description": f"Все цели успевают к сроку при {monthly_budget:,.0f} ₽/мес ({monthly_budget/max(monthly_income, 1)*100:.0f}% дохода)",
                         "action": "Продолжайте следовать плану!"
                     })
+                
+                recommendations.append({
+                    "title": "📅 План взносов",
+                    "description": "Порядок накопления, при котором меньше всего целей срывают срок",
+                    "action": "\n".join(self.describe_goal_schedule(goal) for goal in goal_priorities)
+                })
         
         # Общие рекомендации по распределению
         rent = self.finance_app.data["rent"]
@@ -3295,9 +5348,30 @@ class MainApp:
         
         return recommendations
     
-    def calculate_goal_priorities(self, goals, goal_investments):
+    def describe_goal_schedule(self, goal):
+        """Строка плана цели: с какого по какой месяц откладывать и успеваем ли к сроку"""
+        months = [month for month, amount in enumerate(goal["schedule"]) if amount > 0]
+        if not months:
+            return f"• {goal['name']}: не хватает средств в ближайшие {GOAL_HORIZON_MONTHS // 12} лет"
+        
+        today = datetime.now()
+        def label(offset):
+            year, month = divmod(today.year * 12 + today.month - 1 + offset, 12)
+            return f"{self.get_month_name(month + 1)} {year}"
+        
+        status = "в срок" if goal["on_time"] else f"с опозданием, к сроку не хватит {goal['shortfall']:,.0f} ₽"
+        if goal["completion_month"] is None:
+            status = "не успеть за горизонт планирования"
+        return f"• {goal['name']}: {label(months[0])} - {label(months[-1])}, {status}"
+    
+    def calculate_goal_priorities(self, goals, goal_investments, monthly_budget=None):
+        """Цели с остатком и сроком в будущем.
+        
+        Без monthly_budget цели ранжируются по остатку на день до срока; с ним - в порядке
+        плана allocate_goal_savings, и у каждой цели есть график взносов по месяцам.
+        """
         priorities = []
-        today = datetime.date.today()
+        today = datetime.now().date()
         
         for goal in goals:
             try:
@@ -3316,32 +5390,25 @@ class MainApp:
                         "invested": invested,
                         "remaining": remaining,
                         "days_left": days_left,
+                        "deadline": max(1, (goal_date.year - today.year) * 12 + goal_date.month - today.month),
                         "monthly_needed": monthly_needed,
                         "priority_score": priority_score
                     })
             except:
                 continue
         
-        return sorted(priorities, key=lambda x: x["priority_score"], reverse=True)
+        if monthly_budget is None:
+            return sorted(priorities, key=lambda x: x["priority_score"], reverse=True)
+        
+        return allocate_goal_savings(priorities, monthly_budget)
     
     def create_expense_statistics(self):
-        transactions = self.finance_app.data["transactions"]
         current_month = datetime.now().strftime("%Y-%m")
+        aggregates = self.finance_app.get_aggregates()
         
-        monthly_expenses = sum(
-            t["amount"] for t in transactions 
-            if t["type"] == "expense" and t["date"].startswith(current_month)
-        )
-        
-        monthly_income = sum(
-            t["amount"] for t in transactions 
-            if t["type"] == "income" and t["date"].startswith(current_month)
-        )
-        
-        goal_investments = sum(
-            t["amount"] for t in transactions 
-            if t["type"] == "goal_investment" and t["date"].startswith(current_month)
-        )
+        monthly_expenses = aggregates.total(current_month, "expense")
+        monthly_income = aggregates.total(current_month, "income")
+        goal_investments = aggregates.total(current_month, "goal_investment")
         
         salary = self.finance_app.data["salary"]
         
@@ -3429,15 +5496,13 @@ class MainApp:
                         "date": datetime.now().strftime("%Y-%m-%d %H:%M")
                     }
                     
-                    self.finance_app.data["transactions"].append(transaction)
-                    
                     if transaction_type == "income":
                         self.finance_app.data["current_money"] += amount
                     else:
                         self.finance_app.data["current_money"] -= amount
                     
-                    self.finance_app.save_data()
-                    self.refresh_all_pages()
+                    self.finance_app.add_transaction(transaction)
+                    self.refresh_all_pages("transactions", "current_money")
                     self.page.dialog.open = False
                     self.page.update()
             except ValueError:
@@ -3488,7 +5553,7 @@ class MainApp:
                     self.goal_date_field.value = ""
                     self.goal_date_field.error_text = ""
                     
-                    self.refresh_all_pages()
+                    self.refresh_all_pages("goals")
                     
                 except ValueError:
                     self.goal_date_field.error_text = "Неверный формат даты (используйте YYYY-MM-DD)"
@@ -3518,8 +5583,7 @@ class MainApp:
                         "date": datetime.now().strftime("%Y-%m-%d %H:%M")
                     }
                     
-                    self.finance_app.data["transactions"].append(transaction)
-                    self.finance_app.save_data()
+                    self.finance_app.add_transaction(transaction)
                     
                     self.page.update()
                     self.page.dialog.open = False
@@ -3549,83 +5613,76 @@ class MainApp:
     
     def update_purchase_name(self, e):
         self.purchase_name = e.control.value
+        self.schedule_purchase_analysis()
     
     def update_purchase_price(self, e):
         try:
             self.purchase_price = float(e.control.value) if e.control.value else 0
         except ValueError:
             self.purchase_price = 0
+        self.schedule_purchase_analysis()
     
     def check_purchase_affordability(self, e):
-        if not self.purchase_name or self.purchase_price <= 0:
-            self.purchase_analysis = ft.Text("Введите корректное название и цену", size=14, color=ft.Colors.RED)
-            self.page.update()
-            return
-        
-        analysis = self.calculate_purchase_analysis(self.purchase_price)
-        self.purchase_analysis = analysis
-        self.page.update()
+        self.schedule_purchase_analysis(delay=0)
+    
+    def schedule_purchase_analysis(self, delay=PURCHASE_ANALYSIS_DELAY):
+        """Перезапускает отложенный анализ покупки; результат для уже встречавшейся цены показывается сразу"""
+        name = self.purchase_name
+        price = self.purchase_price
+        key = (name, price, self.page_key())
+        
+        with self.purchase_lock:
+            if self.purchase_timer is not None:
+                self.purchase_timer.cancel()
+                self.purchase_timer = None
+            # Новый ввод делает устаревшими все запущенные ранее расчеты
+            self.purchase_request += 1
+            request = self.purchase_request
+            
+            if price <= 0:
+                cached = ft.Text("Введите цену товара", size=14, color=ft.Colors.GREY_600)
+            else:
+                cached = self.purchase_analysis_cache.get(key)
+                if cached is not None:
+                    self.purchase_analysis_cache.move_to_end(key)
+            
+            if cached is None:
+                self.purchase_timer = threading.Timer(delay, self.run_purchase_analysis, args=(request, key))
+                self.purchase_timer.daemon = True
+                self.purchase_timer.start()
+        
+        if cached is not None:
+            self.show_purchase_analysis(cached)
+    
+    def run_purchase_analysis(self, request, key):
+        # Выполняется в потоке таймера, а не в обработчике ввода. Ленивые индексы и модели
+        # FinanceApp защищены его блокировкой; сами расчеты покупки не перекрываются
+        with self.purchase_run_lock:
+            if request != self.purchase_request:
+                return
+            name, price = key[0], key[1]
+            try:
+                analysis = self.create_simple_purchase_analysis(price, name or "Товар")
+            except Exception as ex:
+                analysis = ft.Text(f"Не удалось проанализировать покупку: {ex}", size=14, color=ft.Colors.RED)
+            else:
+                with self.purchase_lock:
+                    self.purchase_analysis_cache[key] = analysis
+                    if len(self.purchase_analysis_cache) > PURCHASE_ANALYSIS_CACHE_SIZE:
+                        self.purchase_analysis_cache.popitem(last=False)
+        
+        # Пока шел расчет, пользователь ввел другую цену - результат остается только в кэше
+        with self.purchase_lock:
+            if request != self.purchase_request:
+                return
+            self.purchase_timer = None
+        self.show_purchase_analysis(analysis)
     
-    def calculate_purchase_analysis(self, price):
-        current_money = self.finance_app.data["current_money"]
-        salary = self.finance_app.data["salary"]
-        goal_investments = self.finance_app.data["goal_investments"]
-        rent = self.finance_app.data["rent"]
-        safety_reserve = self.finance_app.data["safety_reserve"]
-        
-        # Проверяем нужно ли платить квартплату
-        rent_due = self.check_rent_due()
-        rent_to_pay = rent if rent_due else 0
-        
-        # Свободные деньги (не вложенные в цели, с учетом квартплаты и резерва)
-        free_money = current_money - sum(goal_investments.values()) - rent_to_pay
-        available_for_spending = free_money - safety_reserve
-        
-        # Ежемесячный доход
-        monthly_income = salary
-        
-        # Дневной бюджет с учетом резерва
-        days_until_salary = self.calculate_days_until_salary(self.finance_app.data["salary_dates"][0])
-        daily_budget = available_for_spending / max(days_until_salary, 1)
-        
-        if price <= available_for_spending:
-            # Можем купить прямо сейчас с учетом резерва
-            remaining_after_purchase = available_for_spending - price
-            days_remaining = remaining_after_purchase / daily_budget if daily_budget > 0 else 0
-            
-            return ft.Column([
-                ft.Text("✅ Можете купить прямо сейчас!", size=16, weight=ft.FontWeight.BOLD, color=ft.Colors.GREEN),
-                ft.Text(f"Останется для трат: {remaining_after_purchase:,.0f} ₽"),
-                ft.Text(f"Резерв сохранен: {safety_reserve:,.0f} ₽"),
-                ft.Text(f"Этого хватит на: {days_remaining:.0f} дней"),
-                ft.Text(f"Товар: {self.purchase_name}", size=12, color=ft.Colors.GREY_600)
-            ], spacing=5)
-        
-        elif price <= free_money:
-            # Можем купить, но затронем резерв
-            reserve_impact = price - available_for_spending
-            
-            return ft.Column([
-                ft.Text("⚠️ Можете купить, но затронете резерв", size=16, weight=ft.FontWeight.BOLD, color=ft.Colors.ORANGE),
-                ft.Text(f"Затронете резерв на: {reserve_impact:,.0f} ₽"),
-                ft.Text(f"Останется резерва: {safety_reserve - reserve_impact:,.0f} ₽"),
-                ft.Text(f"Товар: {self.purchase_name}", size=12, color=ft.Colors.GREY_600),
-                ft.Text("⚠️ Не рекомендуется - нарушает финансовую безопасность", size=12, color=ft.Colors.RED)
-            ], spacing=5)
-        
-        else:
-            # Нужно копить
-            needed_amount = price - current_money
-            months_to_save = needed_amount / monthly_income
-            monthly_savings_needed = needed_amount / max(months_to_save, 1)
-            
-            return ft.Column([
-                ft.Text("❌ Нужно копить", size=16, weight=ft.FontWeight.BOLD, color=ft.Colors.RED),
-                ft.Text(f"Не хватает: {needed_amount:,.0f} ₽"),
-                ft.Text(f"Время накопления: {months_to_save:.1f} месяцев"),
-                ft.Text(f"Нужно откладывать: {monthly_savings_needed:,.0f} ₽/мес"),
-                ft.Text(f"Товар: {self.purchase_name}", size=12, color=ft.Colors.GREY_600)
-            ], spacing=5)
+    def show_purchase_analysis(self, analysis):
+        self.purchase_analysis = analysis
+        if hasattr(self, 'purchase_analysis_container'):
+            self.purchase_analysis_container.content = analysis
+            self.page.update()
     
     def create_purchase_analysis(self):
         return self.purchase_analysis
@@ -3727,79 +5784,28 @@ class MainApp:
             self.create_smart_recommendations()
         ], spacing=10)
     
-    def get_monthly_expenses(self, month, year):
-        """Получает расходы за конкретный месяц"""
-        transactions = self.finance_app.data["transactions"]
-        monthly_expenses = {}
-        
-        for transaction in transactions:
-            if transaction["type"] == "expense":
-                try:
-                    date = datetime.strptime(transaction["date"], "%Y-%m-%d %H:%M")
-                    if date.month == month and date.year == year:
-                        category = transaction.get("category", "Прочее")
-                        if category not in monthly_expenses:
-                            monthly_expenses[category] = 0
-                        monthly_expenses[category] += transaction["amount"]
-                except:
-                    continue
-        
-        return monthly_expenses
+    def get_expense_forecast(self, months_ahead=0):
+        """Прогноз обычных расходов (без плановых платежей) на месяц через months_ahead
+        от текущего (None без обученной модели)"""
+        year, month = recent_months(1)[0]
+        year, month = divmod(year * 12 + month - 1 + months_ahead, 12)
+        forecast = self.finance_app.get_forecaster().predict(month_key(year, month + 1))
+        return sum(forecast.values()) if forecast is not None else None
+    
+    def get_period_expenses(self, start, end):
+        """Получает расходы по категориям за произвольный период [start, end) (даты YYYY-MM-DD)"""
+        return self.analytics_engine.category_totals("expense", start, end)
     
     def calculate_average_monthly_expenses(self):
-        transactions = self.finance_app.data["transactions"]
-        
-        # Базовые расходы 10,000 ₽/месяц
-        base_expenses = 10000
-        
-        # Временно возвращаем базовые расходы 10,000 ₽
-        # Позже можно будет включить динамический расчет
-        return base_expenses
-        
-        # Закомментированный код для будущего динамического расчета:
-        # if not transactions:
-        #     return base_expenses
-        # 
-        # months_with_data = {}
-        # for transaction in transactions:
-        #     if transaction["type"] == "expense":
-        #         month_str = transaction["date"][:7]  # YYYY-MM
-        #         if month_str not in months_with_data:
-        #             months_with_data[month_str] = 0
-        #         months_with_data[month_str] += transaction["amount"]
-        # 
-        # if not months_with_data:
-        #     return base_expenses
-        # 
-        # sorted_months = sorted(months_with_data.keys(), reverse=True)
-        # months_to_use = sorted_months[:3] if len(sorted_months) >= 3 else sorted_months
-        # 
-        # total_expenses = sum(months_with_data[month] for month in months_to_use)
-        # average_expenses = total_expenses / len(months_to_use)
-        # 
-        # return average_expenses
+        return self.get_analytics().average_monthly_expenses
     
     def get_current_month_expenses(self):
         """Получает расходы за текущий месяц"""
-        transactions = self.finance_app.data["transactions"]
-        current_month = datetime.now().strftime("%Y-%m")
-        
-        current_expenses = sum(
-            t["amount"] for t in transactions 
-            if t["type"] == "expense" and t["date"].startswith(current_month)
-        )
-        return current_expenses
+        return self.get_analytics().month_expenses
     
     def get_current_month_income(self):
         """Получает доходы за текущий месяц"""
-        transactions = self.finance_app.data["transactions"]
-        current_month = datetime.now().strftime("%Y-%m")
-        
-        current_income = sum(
-            t["amount"] for t in transactions 
-            if t["type"] == "income" and t["date"].startswith(current_month)
-        )
-        return current_income
+        return self.get_analytics().month_income
     
     def create_smart_recommendations(self):
         current_money = self.finance_app.data["current_money"]
@@ -3839,7 +5845,7 @@ class MainApp:
         # Анализ целей
         goals = self.finance_app.data["goals"]
         if goals:
-            total_goal_amount = sum(goal["amount"] for goal in goals)
+            total_goal_amount = self.get_analytics().goal_total
             total_invested = sum(self.finance_app.data["goal_investments"].values())
             remaining = total_goal_amount - total_invested
             
@@ -4041,7 +6047,7 @@ class MainApp:
         
         # Цели (20 баллов)
         if goals:
-            total_goal_amount = sum(goal["amount"] for goal in goals)
+            total_goal_amount = self.get_analytics().goal_total
             if total_goal_amount > 0:
                 goal_progress = goal_investments / total_goal_amount
                 score += int(20 * goal_progress)
@@ -4090,7 +6096,7 @@ class MainApp:
         
         # Анализ целей
         if goals:
-            total_goal_amount = sum(goal["amount"] for goal in goals)
+            total_goal_amount = self.get_analytics().goal_total
             total_invested = sum(self.finance_app.data["goal_investments"].values())
             if total_invested < total_goal_amount * 0.1:
                 recommendations.append(
@@ -4147,8 +6153,8 @@ class MainApp:
         ], spacing=10)
     
     def analyze_expense_categories(self):
-        transactions = self.finance_app.data["transactions"]
-        current_month = datetime.now().strftime("%Y-%m")
+        today = datetime.now()
+        start, end = month_range(today.year, today.month)
         
         categories = {}
         category_names = {
@@ -4162,31 +6168,24 @@ class MainApp:
             "other": "📦 Прочее"
         }
         
-        for transaction in transactions:
-            if transaction["type"] == "expense" and transaction["date"].startswith(current_month):
-                amount = transaction["amount"]
-                category = transaction.get("category", "other")
-                category_name = category_names.get(category, "📦 Прочее")
-                categories[category_name] = categories.get(category_name, 0) + amount
+        for category, amount in self.analytics_engine.category_totals("expense", start, end).items():
+            category_name = category_names.get(category, "📦 Прочее")
+            categories[category_name] = categories.get(category_name, 0) + amount
         
         return dict(sorted(categories.items(), key=lambda x: x[1], reverse=True))
     
     def calculate_trends(self):
-        transactions = self.finance_app.data["transactions"]
+        aggregates = self.finance_app.get_aggregates()
         
         # Сравниваем последние 2 месяца
         current_month = datetime.now().strftime("%Y-%m")
         last_month = (datetime.now() - timedelta(days=30)).strftime("%Y-%m")
         
-        current_expenses = sum(t["amount"] for t in transactions 
-                             if t["type"] == "expense" and t["date"].startswith(current_month))
-        last_expenses = sum(t["amount"] for t in transactions 
-                          if t["type"] == "expense" and t["date"].startswith(last_month))
+        current_expenses = aggregates.total(current_month, "expense")
+        last_expenses = aggregates.total(last_month, "expense")
         
-        current_income = sum(t["amount"] for t in transactions 
-                           if t["type"] == "income" and t["date"].startswith(current_month))
-        last_income = sum(t["amount"] for t in transactions 
-                        if t["type"] == "income" and t["date"].startswith(last_month))
+        current_income = aggregates.total(current_month, "income")
+        last_income = aggregates.total(last_month, "income")
         
         return {
             "expense_trend": "↗️ Растут" if current_expenses > last_expenses else "↘️ Снижаются",
@@ -4195,7 +6194,7 @@ class MainApp:
         }
     
     def create_monthly_chart(self):
-        transactions = self.finance_app.data["transactions"]
+        aggregates = self.finance_app.get_aggregates()
         
         # Создаем данные за последние 6 месяцев
         months_data = []
@@ -4204,10 +6203,8 @@ class MainApp:
             month_str = month_date.strftime("%Y-%m")
             month_name = month_date.strftime("%b")
             
-            month_income = sum(t["amount"] for t in transactions 
-                             if t["type"] == "income" and t["date"].startswith(month_str))
-            month_expenses = sum(t["amount"] for t in transactions 
-                               if t["type"] == "expense" and t["date"].startswith(month_str))
+            month_income = aggregates.total(month_str, "income")
+            month_expenses = aggregates.total(month_str, "expense")
             
             months_data.append({
                 "month": month_name,
@@ -4606,10 +6603,9 @@ class MainApp:
     
     def create_my_games_analysis(self):
         # Анализ игровых трат
-        game_transactions = [t for t in self.finance_app.data["transactions"] 
-                           if t.get("category") == "games"]
-        monthly_game_spending = sum(t["amount"] for t in game_transactions 
-                                  if t["type"] == "expense" and t["date"].startswith(datetime.now().strftime("%Y-%m")))
+        current_month = datetime.now().strftime("%Y-%m")
+        monthly_game_spending = ledger_sum(t for t in self.finance_app.get_ledger()
+                                           if t.category == "games" and t.type == "expense" and t.month_key == current_month)
         
         salary = self.finance_app.data["salary"]
         recommended_game_budget = salary * 0.05  # 5% от дохода на игры
@@ -4648,10 +6644,9 @@ class MainApp:
     
     def create_my_food_analysis(self):
         # Анализ трат на еду
-        food_transactions = [t for t in self.finance_app.data["transactions"] 
-                           if t.get("category") in ["food", "restaurants"]]
-        monthly_food_spending = sum(t["amount"] for t in food_transactions 
-                                  if t["type"] == "expense" and t["date"].startswith(datetime.now().strftime("%Y-%m")))
+        current_month = datetime.now().strftime("%Y-%m")
+        monthly_food_spending = ledger_sum(t for t in self.finance_app.get_ledger()
+                                           if t.category in ("food", "restaurants") and t.type == "expense" and t.month_key == current_month)
         
         salary = self.finance_app.data["salary"]
         recommended_food_budget = salary * 0.15  # 15% от дохода на еду
@@ -4690,10 +6685,9 @@ class MainApp:
     
     def create_my_purchases_analysis(self):
         # Анализ покупок электроники
-        electronics_transactions = [t for t in self.finance_app.data["transactions"] 
-                                  if t.get("category") == "electronics"]
-        monthly_electronics_spending = sum(t["amount"] for t in electronics_transactions 
-                                         if t["type"] == "expense" and t["date"].startswith(datetime.now().strftime("%Y-%m")))
+        current_month = datetime.now().strftime("%Y-%m")
+        monthly_electronics_spending = ledger_sum(t for t in self.finance_app.get_ledger()
+                                                  if t.category == "electronics" and t.type == "expense" and t.month_key == current_month)
         
         salary = self.finance_app.data["salary"]
         recommended_electronics_budget = salary * 0.15  # 15% от дохода на электронику
@@ -4732,16 +6726,15 @@ class MainApp:
     
     def create_my_monthly_analysis(self):
         # Анализ по месяцам
-        transactions = self.finance_app.data["transactions"]
         current_year = datetime.now().year
+        year_transactions = [t for t in self.finance_app.get_ledger() if t.year == current_year]
         
         monthly_data = {}
         for month in range(1, 13):
-            month_str = f"{current_year}-{month:02d}"
-            month_transactions = [t for t in transactions if t["date"].startswith(month_str)]
+            month_transactions = [t for t in year_transactions if t.month == month]
             
-            income = sum(t["amount"] for t in month_transactions if t["type"] == "income")
-            expenses = sum(t["amount"] for t in month_transactions if t["type"] == "expense")
+            income = ledger_sum(t for t in month_transactions if t.type == "income")
+            expenses = ledger_sum(t for t in month_transactions if t.type == "expense")
             
             monthly_data[month] = {
                 "income": income,
@@ -5082,7 +7075,7 @@ class MainApp:
                 content=ft.Container(
                     content=ft.Column([
                         ft.Text("📋 Мои заметки", size=18, weight=ft.FontWeight.BOLD),
-                        self.create_notes_list()
+                        self.bind(["notes"], self.create_notes_list)
                     ], spacing=10),
                     padding=20
                 )
@@ -5694,7 +7687,7 @@ class MainApp:
         current_year = datetime.now().year
         
         # Анализ расходов по категориям за текущий месяц
-        monthly_expenses = self.get_monthly_expenses(current_month, current_year)
+        monthly_expenses = self.finance_app.get_aggregates().category_totals(month_key(current_year, current_month), "expense")
         budget_categories = self.finance_app.data["settings"]["budget_categories"]
         
         # Создаем визуальные элементы для категорий
@@ -5725,6 +7718,7 @@ class MainApp:
             )
         
         # График доходов и расходов за последние 6 месяцев
+        aggregates = self.finance_app.get_aggregates()
         monthly_data = []
         for i in range(6):
             month = current_month - i
@@ -5733,13 +7727,13 @@ class MainApp:
                 month += 12
                 year -= 1
             
-            month_expenses = self.get_monthly_expenses(month, year)
             month_income = self.finance_app.data["salary"]
             
             monthly_data.append({
                 "month": f"{month:02d}.{year}",
                 "income": month_income,
-                "expenses": sum(month_expenses.values()) if month_expenses else 0
+                "expenses": aggregates.total(month_key(year, month), "expense"),
+                "balance": self.finance_app.balance_at(month_range(year, month)[1])
             })
         
         monthly_data.reverse()  # От старых к новым
@@ -5762,6 +7756,23 @@ class MainApp:
                 ], spacing=2)
             )
         
+        # Баланс на конец месяца
+        max_balance = max((abs(data["balance"]) for data in monthly_data), default=0)
+        balance_bars = []
+        for data in monthly_data:
+            color = ft.Colors.GREEN if data["balance"] >= 0 else ft.Colors.RED
+            balance_bars.append(
+                ft.Column([
+                    ft.Text(f"{data['month']}: {data['balance']:,.0f} ₽", size=10),
+                    ft.ProgressBar(
+                        value=abs(data["balance"]) / max_balance if max_balance > 0 else 0,
+                        color=color,
+                        bgcolor=ft.Colors.GREY_300,
+                        width=250
+                    )
+                ], spacing=2)
+            )
+        
         return ft.Column([
             ft.Text("Расходы по категориям (текущий месяц):", size=14, weight=ft.FontWeight.BOLD),
             *category_bars,
@@ -5773,6 +7784,11 @@ class MainApp:
             
             ft.Divider(),
             
+            ft.Text("Баланс на конец месяца:", size=14, weight=ft.FontWeight.BOLD),
+            *balance_bars,
+            
+            ft.Divider(),
+            
             ft.Text("Прогресс целей:", size=14, weight=ft.FontWeight.BOLD),
             self.create_goals_progress_bars()
         ], spacing=10)
@@ -5812,32 +7828,13 @@ class MainApp:
         return ft.Column(progress_bars, spacing=8)
     
     def create_trend_analysis(self):
-        current_month = datetime.now().month
-        current_year = datetime.now().year
-        
-        # Анализ трендов за последние 12 месяцев
-        trends = []
-        for i in range(12):
-            month = current_month - i
-            year = current_year
-            if month <= 0:
-                month += 12
-                year -= 1
-            
-            month_expenses = self.get_monthly_expenses(month, year)
-            total_expenses = sum(month_expenses.values()) if month_expenses else 0
-            month_income = self.finance_app.data["salary"]
-            savings = month_income - total_expenses
-            
-            trends.append({
-                "month": f"{month:02d}.{year}",
-                "income": month_income,
-                "expenses": total_expenses,
-                "savings": savings,
-                "savings_rate": (savings / month_income * 100) if month_income > 0 else 0
-            })
+        # Фактические доходы и расходы за 5 лет одним проходом; на экране - последние 12 месяцев
+        history = self.analytics_engine.monthly_trends(60)
+        trends = history[-12:]
         
-        trends.reverse()  # От старых к новым
+        # Для сезонности отбрасываем месяцы до первой записи
+        first = next((i for i, t in enumerate(history) if t["income"] or t["expenses"]), len(history))
+        history = history[first:]
         
         # Анализ трендов
         if len(trends) >= 3:
@@ -5850,7 +7847,7 @@ class MainApp:
             savings_trend = "📈 Растет" if recent_avg > older_avg else "📉 Падает" if recent_avg < older_avg else "➡️ Стабильно"
             
             # Анализ сезонности
-            seasonal_analysis = self.analyze_seasonality(trends)
+            seasonal_analysis = self.analyze_seasonality(history)
             
             # Прогноз на следующий месяц
             next_month_forecast = self.forecast_next_month(trends)
@@ -5883,18 +7880,8 @@ class MainApp:
         if len(trends) < 6:
             return "Недостаточно данных для анализа"
         
-        # Группируем по месяцам года
-        monthly_averages = {}
-        for trend in trends:
-            month = int(trend["month"].split('.')[0])
-            if month not in monthly_averages:
-                monthly_averages[month] = []
-            monthly_averages[month].append(trend["expenses"])
-        
-        # Находим самые дорогие и дешевые месяцы
-        avg_by_month = {}
-        for month, expenses in monthly_averages.items():
-            avg_by_month[month] = sum(expenses) / len(expenses)
+        # Средние расходы по месяцам года
+        avg_by_month = self.analytics_engine.calendar_month_averages(trends, "expenses")
         
         if not avg_by_month:
             return "Недостаточно данных"
@@ -5911,12 +7898,20 @@ class MainApp:
         if len(trends) < 3:
             return "Недостаточно данных для прогноза"
         
-        # Простой прогноз на основе среднего за последние 3 месяца
+        # Прогноз модели по категориям плюс плановые платежи, как в среднем за последние
+        # 3 закрытых месяца; без модели - среднее всех расходов за последние 3 месяца
         recent_trends = trends[-3:]
-        avg_expenses = sum(t["expenses"] for t in recent_trends) / len(recent_trends)
+        avg_expenses = self.get_expense_forecast(1)
+        if avg_expenses is None:
+            avg_expenses = sum(t["expenses"] for t in recent_trends) / len(recent_trends)
+        else:
+            scheduled = self.finance_app.get_scheduled_expenses()
+            recent = [month_key(year, month) for year, month in recent_months(4)[:-1]]
+            avg_expenses += sum(sum(scheduled.get(month, {}).values()) for month in recent) / len(recent) / KOPECKS
         avg_savings = sum(t["savings"] for t in recent_trends) / len(recent_trends)
         
-        current_income = self.finance_app.data["salary"]
+        # Фактический доход; если доходы не записывались - зарплата из настроек
+        current_income = sum(t["income"] for t in recent_trends) / len(recent_trends) or self.finance_app.data["salary"]
         forecast_savings = current_income - avg_expenses
         
         return f"Прогнозируемые расходы: {avg_expenses:,.0f} ₽\nПрогнозируемые сбережения: {forecast_savings:,.0f} ₽"
@@ -5946,19 +7941,25 @@ class MainApp:
             *table_rows
         ], spacing=2)
     
-    def create_period_comparison(self):
+    def create_period_comparison(self, current_period=None, prev_period=None):
+        """Сравнивает расходы двух периодов (start, end); по умолчанию текущий и предыдущий месяц"""
         current_month = datetime.now().month
         current_year = datetime.now().year
         
         # Сравниваем текущий месяц с предыдущим
-        current_expenses = self.get_monthly_expenses(current_month, current_year)
         prev_month = current_month - 1
         prev_year = current_year
         if prev_month <= 0:
             prev_month += 12
             prev_year -= 1
         
-        prev_expenses = self.get_monthly_expenses(prev_month, prev_year)
+        if current_period is None:
+            current_period = month_range(current_year, current_month)
+        if prev_period is None:
+            prev_period = month_range(prev_year, prev_month)
+        
+        current_expenses = self.get_period_expenses(*current_period)
+        prev_expenses = self.get_period_expenses(*prev_period)
         
         current_total = sum(current_expenses.values()) if current_expenses else 0
         prev_total = sum(prev_expenses.values()) if prev_expenses else 0
@@ -5966,6 +7967,10 @@ class MainApp:
         difference = current_total - prev_total
         percent_change = (difference / prev_total * 100) if prev_total > 0 else 0
         
+        current_flow = self.finance_app.net_flow(*current_period)
+        prev_flow = self.finance_app.net_flow(*prev_period)
+        balance_at_end = self.finance_app.balance_at(current_period[1])
+        
         # Сравнение по категориям
         category_comparison = []
         all_categories = set(current_expenses.keys()) | set(prev_expenses.keys())
@@ -5997,6 +8002,12 @@ class MainApp:
                 ft.Text(f"Изменение: {difference:+,.0f} ₽ ({percent_change:+.1f}%)", 
                        size=12, color=ft.Colors.RED if difference > 0 else ft.Colors.GREEN)
             ]),
+            ft.Row([
+                ft.Text(f"Чистый поток: {current_flow:+,.0f} ₽", size=12,
+                       color=ft.Colors.GREEN if current_flow >= 0 else ft.Colors.RED),
+                ft.Text(f"Предыдущий: {prev_flow:+,.0f} ₽", size=12),
+                ft.Text(f"Баланс на конец периода: {balance_at_end:,.0f} ₽", size=12)
+            ]),
             
             ft.Divider(),
             
@@ -6071,8 +8082,7 @@ class MainApp:
         salary = self.finance_app.data["salary"]
         current_month = datetime.now().month
         current_year = datetime.now().year
-        monthly_expenses = self.get_monthly_expenses(current_month, current_year)
-        total_expenses = sum(monthly_expenses.values()) if monthly_expenses else 0
+        total_expenses = self.finance_app.get_aggregates().total(month_key(current_year, current_month), "expense")
         return salary - total_expenses
     
     def analyze_goal_impact(self, goal_name, goal_amount, invested):
@@ -6108,7 +8118,7 @@ class MainApp:
         # Анализ категорий расходов для оптимизации
         current_month = datetime.now().month
         current_year = datetime.now().year
-        monthly_expenses = self.get_monthly_expenses(current_month, current_year)
+        monthly_expenses = self.finance_app.get_aggregates().category_totals(month_key(current_year, current_month), "expense")
         budget_categories = self.finance_app.data["settings"]["budget_categories"]
         
         for category, percentage in budget_categories.items():
@@ -6127,6 +8137,7 @@ class MainApp:
         current_month = datetime.now().month
         current_year = datetime.now().year
         
+        aggregates = self.finance_app.get_aggregates()
         patterns = []
         for i in range(3):
             month = current_month - i
@@ -6135,7 +8146,7 @@ class MainApp:
                 month += 12
                 year -= 1
             
-            month_expenses = self.get_monthly_expenses(month, year)
+            month_expenses = aggregates.category_totals(month_key(year, month), "expense")
             if month_expenses:
                 patterns.append(month_expenses)
         
@@ -6174,18 +8185,10 @@ class MainApp:
             return ft.Text("Нет данных о транзакциях", size=12, color=ft.Colors.GREY_600)
         
         # Группируем по дням недели (упрощенный анализ)
-        weekday_totals = {}
-        for transaction in transactions:
-            try:
-                date = datetime.strptime(transaction["date"], "%Y-%m-%d %H:%M")
-                weekday = date.strftime("%A")
-                amount = transaction["amount"]
-                
-                if weekday not in weekday_totals:
-                    weekday_totals[weekday] = 0
-                weekday_totals[weekday] += amount
-            except:
-                continue
+        weekday_totals = {
+            WEEKDAY_NAMES[weekday]: amount
+            for weekday, amount in self.analytics_engine.weekday_totals().items()
+        }
         
         if not weekday_totals:
             return ft.Text("Не удалось проанализировать дни недели", size=12, color=ft.Colors.GREY_600)
@@ -6205,31 +8208,22 @@ class MainApp:
         ], spacing=5)
     
     def analyze_impulse_purchases(self):
-        # Анализ транзакций на предмет импульсивных покупок
-        transactions = self.finance_app.data["transactions"]
-        
-        impulse_indicators = []
-        total_impulse = 0
+        # Отметки ставит AnomalyDetector при поступлении транзакций
+        flagged = self.finance_app.get_anomalies().flagged
         
-        for transaction in transactions:
-            if transaction["type"] == "expense":
-                amount = transaction["amount"]
-                description = transaction["description"].lower()
-                
-                # Простые индикаторы импульсивных покупок
-                if any(word in description for word in ["импульс", "спонтан", "внезапно", "быстро"]):
-                    impulse_indicators.append(f"• {transaction['description']}: {amount:,.0f} ₽")
-                    total_impulse += amount
-                elif amount > 5000 and any(word in description for word in ["подарок", "сюрприз", "неожиданно"]):
-                    impulse_indicators.append(f"• {transaction['description']}: {amount:,.0f} ₽")
-                    total_impulse += amount
-        
-        if not impulse_indicators:
+        if not flagged:
             return ft.Text("✅ Импульсивных покупок не обнаружено", size=12, color=ft.Colors.GREEN)
         
+        impulse_indicators = []
+        for t in flagged[:5]:  # Показываем первые 5
+            indicator = f"• {t.source.get('description', '')}: {t.amount / KOPECKS:,.0f} ₽"
+            if t.flag == "outlier":
+                indicator += f" (необычно много для категории «{t.category}»)"
+            impulse_indicators.append(indicator)
+        
         return ft.Column([
-            ft.Text(f"Обнаружено импульсивных покупок на сумму: {total_impulse:,.0f} ₽", size=12, color=ft.Colors.ORANGE),
-            *[ft.Text(indicator, size=10) for indicator in impulse_indicators[:5]]  # Показываем первые 5
+            ft.Text(f"Обнаружено импульсивных покупок на сумму: {ledger_sum(flagged):,.0f} ₽", size=12, color=ft.Colors.ORANGE),
+            *[ft.Text(indicator, size=10) for indicator in impulse_indicators]
         ], spacing=5)
     
     def find_budget_holes(self, patterns):
@@ -6408,8 +8402,9 @@ class MainApp:
 ========================
 """
         
-        recent_transactions = self.finance_app.data["transactions"][-10:]
-        for transaction in recent_transactions:
+        recent_transactions = self.finance_app.latest_transactions(10)
+        for t in recent_transactions:
+            transaction = t.source
             report += f"{transaction['date']} | {transaction['type']} | {transaction['amount']:,.0f} ₽ | {transaction['description']}\n"
         
         return report
@@ -6449,17 +8444,24 @@ class MainApp:
             self.page.snack_bar.open = True
             self.page.update()
     
-    def generate_monthly_report(self):
+    def generate_monthly_report(self, start=None, end=None):
+        """Отчет за период [start, end) (даты YYYY-MM-DD); по умолчанию за текущий месяц"""
         current_month = datetime.now().month
         current_year = datetime.now().year
         
-        monthly_expenses = self.get_monthly_expenses(current_month, current_year)
+        if start is None or end is None:
+            start, end = month_range(current_year, current_month)
+            title = f"МЕСЯЧНЫЙ ОТЧЕТ - {current_month:02d}.{current_year}"
+        else:
+            title = f"ОТЧЕТ ЗА ПЕРИОД {start} - {end}"
+        
+        monthly_expenses = self.get_period_expenses(start, end)
         total_expenses = sum(monthly_expenses.values()) if monthly_expenses else 0
         salary = self.finance_app.data["salary"]
         savings = salary - total_expenses
         
-        return f"""
-МЕСЯЧНЫЙ ОТЧЕТ - {current_month:02d}.{current_year}
+        report = f"""
+{title}
 ==============================================
 
 ДОХОДЫ
@@ -6479,7 +8481,7 @@ class MainApp:
 =====
 Общие расходы: {total_expenses:,.0f} ₽
 Сбережения: {savings:,.0f} ₽
-Ставка сбережений: {(savings/salary*100):.1f}%
+Ставка сбережений: {(savings / salary * 100) if salary > 0 else 0:.1f}%
 """
         
         return report
@@ -6556,7 +8558,7 @@ class MainApp:
         
         # Получаем текущий месяц
         current_month = datetime.now().month
-        current_year = 2025  # Устанавливаем 2025 год
+        current_year = datetime.now().year
         
         def should_pay_rent(month, year):
             """Определяет, нужно ли платить квартплату в указанном месяце"""
@@ -6696,7 +8698,11 @@ class MainApp:
                 forecast_year = current_year + ((current_month - 1 + i) // 12)
                 rent_for_month = rent_cost if should_pay_rent(month, forecast_year) else 0
                 holiday_cost = holidays.get(month, {}).get("cost", 0)
-                expenses = monthly_expenses + chatgpt_cost + rent_for_month
+                # Обычные расходы месяца - по модели, если она обучена
+                predicted_expenses = self.get_expense_forecast(i)
+                if predicted_expenses is None:
+                    predicted_expenses = monthly_expenses
+                expenses = predicted_expenses + chatgpt_cost + rent_for_month
                 total_expenses = expenses + holiday_cost
             
             # Баланс
@@ -6711,6 +8717,19 @@ class MainApp:
                 "holiday": holidays.get(month, {}).get("name", "")
             })
         
+        # Вероятностный прогноз от конца текущего месяца: обязательные платежи по календарю,
+        # обычные расходы - из истории
+        net_schedule = []
+        for i in range(1, SIMULATION_MONTHS + 1):
+            month = ((current_month - 1 + i) % 12) + 1
+            forecast_year = current_year + ((current_month - 1 + i) // 12)
+            rent_for_month = rent_cost if should_pay_rent(month, forecast_year) else 0
+            net_schedule.append(salary - chatgpt_cost - rent_for_month - holidays.get(month, {}).get("cost", 0))
+        simulation = simulate_balance(
+            monthly_forecast[0]["balance"], net_schedule, self.finance_app.monthly_expense_history(),
+            safety_reserve, seed=self.finance_app.data_version
+        )
+        
         return ft.Column([
             ft.Text("📅 Прогноз по месяцам:", size=16, weight=ft.FontWeight.BOLD),
             
@@ -6867,9 +8886,51 @@ class MainApp:
                 bgcolor=ft.Colors.LIGHT_BLUE_50,
                 border_radius=8,
                 border=ft.border.all(1, ft.Colors.BLUE_200)
-            )
+            ),
+            
+            self.create_balance_simulation(simulation, safety_reserve)
         ], spacing=5)
     
+    def create_balance_simulation(self, simulation, safety_reserve):
+        """Карточка вероятностного прогноза: коридор баланса и риск уйти ниже резерва"""
+        if simulation is None:
+            return ft.Text("🎲 Вероятностный прогноз появится после 3 месяцев истории расходов", size=12, color=ft.Colors.GREY_600)
+        
+        today = datetime.now()
+        rows = []
+        # Каждый третий месяц горизонта
+        for i in range(2, SIMULATION_MONTHS, 3):
+            year, month = divmod(today.year * 12 + today.month + i, 12)
+            risk = simulation["below_reserve_by_month"][i]
+            rows.append(ft.Row([
+                ft.Text(f"{self.get_month_name(month + 1)} {year}", size=12, expand=2),
+                ft.Text(f"{simulation['p10'][i]:,.0f} ₽", size=12, color=ft.Colors.RED, expand=1),
+                ft.Text(f"{simulation['p50'][i]:,.0f} ₽", size=12, weight=ft.FontWeight.BOLD, expand=1),
+                ft.Text(f"{simulation['p90'][i]:,.0f} ₽", size=12, color=ft.Colors.GREEN, expand=1),
+                ft.Text(f"{risk:.0%}", size=12, color=ft.Colors.RED if risk > 0.2 else ft.Colors.GREY_700, expand=1)
+            ]))
+        
+        risk = simulation["below_reserve"]
+        return ft.Container(
+            content=ft.Column([
+                ft.Text(f"🎲 Вероятностный прогноз на {SIMULATION_MONTHS} мес. ({SIMULATION_PATHS:,} сценариев):", size=16, weight=ft.FontWeight.BOLD),
+                ft.Text(f"Вероятность опуститься ниже резерва ({safety_reserve:,.0f} ₽): {risk:.0%}", size=14,
+                       color=ft.Colors.RED if risk > 0.2 else ft.Colors.ORANGE if risk > 0.05 else ft.Colors.GREEN),
+                ft.Row([
+                    ft.Text("Месяц", size=12, weight=ft.FontWeight.BOLD, expand=2),
+                    ft.Text("Плохой (10%)", size=12, weight=ft.FontWeight.BOLD, expand=1),
+                    ft.Text("Ожидаемый", size=12, weight=ft.FontWeight.BOLD, expand=1),
+                    ft.Text("Хороший (90%)", size=12, weight=ft.FontWeight.BOLD, expand=1),
+                    ft.Text("Риск", size=12, weight=ft.FontWeight.BOLD, expand=1)
+                ]),
+                *rows
+            ], spacing=8),
+            padding=15,
+            bgcolor=ft.Colors.WHITE,
+            border_radius=8,
+            border=ft.border.all(1, ft.Colors.BLUE_200)
+        )
+    
     def create_holidays_forecast(self):
         holidays = {
             "Новый год": {"cost": 20000, "description": "Подарки семье и друзьям, еда, алкоголь, украшения"},
@@ -7102,10 +9163,9 @@ class MainApp:
         available_for_wants = current_money - safety_reserve
         
         # Анализ игровых трат
-        game_transactions = [t for t in self.finance_app.data["transactions"] 
-                           if t.get("category") == "games"]
-        monthly_game_spending = sum(t["amount"] for t in game_transactions 
-                                  if t["type"] == "expense" and t["date"].startswith(datetime.now().strftime("%Y-%m")))
+        current_month = datetime.now().strftime("%Y-%m")
+        monthly_game_spending = ledger_sum(t for t in self.finance_app.get_ledger()
+                                           if t.category == "games" and t.type == "expense" and t.month_key == current_month)
         
         # Рекомендации по играм
         recommended_game_budget = wants_budget * 0.2  # 20% от бюджета желаний на игры
@@ -7158,10 +9218,9 @@ class MainApp:
         salary = self.finance_app.data["salary"]
         
         # Анализ трат на еду
-        food_transactions = [t for t in self.finance_app.data["transactions"] 
-                           if t.get("category") in ["food", "restaurants"]]
-        monthly_food_spending = sum(t["amount"] for t in food_transactions 
-                                  if t["type"] == "expense" and t["date"].startswith(datetime.now().strftime("%Y-%m")))
+        current_month = datetime.now().strftime("%Y-%m")
+        monthly_food_spending = ledger_sum(t for t in self.finance_app.get_ledger()
+                                           if t.category in ("food", "restaurants") and t.type == "expense" and t.month_key == current_month)
         
         # Рекомендации по еде
         recommended_food_budget = salary * 0.15  # 15% от дохода на еду
@@ -7243,10 +9302,12 @@ class MainApp:
         ]
         
         # Текущие подписки (из транзакций)
-        subscription_transactions = [t for t in self.finance_app.data["transactions"] 
-                                   if any(word in t["description"].lower() for word in ["подписка", "subscription", "netflix", "spotify", "youtube", "microsoft", "adobe", "playstation", "xbox"])]
-        monthly_subscription_spending = sum(t["amount"] for t in subscription_transactions 
-                                          if t["type"] == "expense" and t["date"].startswith(datetime.now().strftime("%Y-%m")))
+        current_month = datetime.now().strftime("%Y-%m")
+        monthly_subscription_spending = ledger_sum(
+            t for t in self.finance_app.get_ledger()
+            if t.type == "expense" and t.month_key == current_month
+            and any(word in t.source["description"].lower() for word in ["подписка", "subscription", "netflix", "spotify", "youtube", "microsoft", "adobe", "playstation", "xbox"])
+        )
         
         # Добавляем ChatGPT если включен
         if self.finance_app.data["chatgpt_enabled"]:
@@ -7722,11 +9783,10 @@ class MainApp:
     def create_investment_portfolio(self):
         current_money = self.finance_app.data["current_money"]
         safety_reserve = self.finance_app.data["safety_reserve"]
-        goal_investments = self.finance_app.data["goal_investments"]
         salary = self.finance_app.data["salary"]
         
         # Расчеты
-        total_invested = sum(goal_investments.values())
+        total_invested = self.get_analytics().goal_invested
         available_for_investment = current_money - safety_reserve - total_invested
         investment_ratio = total_invested / current_money if current_money > 0 else 0
         
@@ -8135,10 +10195,9 @@ class MainApp:
         
         # Статистика за год
         current_year = datetime.now().year
-        year_income = sum(t["amount"] for t in transactions 
-                         if t["type"] == "income" and str(current_year) in t["date"])
-        year_expenses = sum(t["amount"] for t in transactions 
-                           if t["type"] == "expense" and str(current_year) in t["date"])
+        ledger = self.finance_app.get_ledger()
+        year_income = ledger_sum(t for t in ledger if t.type == "income" and t.year == current_year)
+        year_expenses = ledger_sum(t for t in ledger if t.type == "expense" and t.year == current_year)
         year_savings = year_income - year_expenses
         
         return ft.Column([
@@ -8241,8 +10300,10 @@ class MainApp:
         self.show_export_dialog("PDF отчет создан!")
     
     def create_backup(self, e):
-        # Заглушка для создания резервной копии
-        self.show_export_dialog("Резервная копия создана!")
+        os.makedirs("reports", exist_ok=True)
+        backup_file = f"reports/backup_{datetime.now().strftime('%Y%m%d_%H%M')}.json"
+        self.finance_app.export_json(backup_file)
+        self.show_export_dialog(f"Резервная копия создана: {backup_file}")
     
     def show_export_dialog(self, message):
         dialog = ft.AlertDialog(
@@ -8577,7 +10638,7 @@ class MainApp:
     def delete_note(self, note_id):
         self.finance_app.data["notes"] = [note for note in self.finance_app.data["notes"] if note["id"] != note_id]
         self.finance_app.save_data()
-        self.refresh_all_pages()
+        self.refresh_all_pages("notes")
 
 def main(page: ft.Page):
     app = MainApp(page)
@@ -0,0 +1,39 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def make_app(tmp_path, monkeypatch):
+    """Фабрика FinanceApp в пустом временном каталоге (файлы данных лежат по относительным путям)"""
+    main = pytest.importorskip("main")
+    monkeypatch.chdir(tmp_path)
+    apps = []
+
+    def make(**kwargs):
+        kwargs.setdefault("save_delay", 0)
+        kwargs.setdefault("storage", "json")
+        app = main.FinanceApp(**kwargs)
+        apps.append(app)
+        return app
+
+    yield make
+    # Досохраняем здесь, пока текущий каталог - временный, а не при выходе через atexit
+    for app in apps:
+        app.close()
+
+
+@pytest.fixture
+def make_transaction():
+    def make(amount, date, transaction_type="expense", category="food", description="тест"):
+        return {
+            "type": transaction_type,
+            "amount": amount,
+            "category": category,
+            "description": description,
+            "date": date
+        }
+    return make
@@ -0,0 +1,108 @@
+import random
+
+import pytest
+
+main = pytest.importorskip("main")
+
+TYPES = ["income", "expense", "goal_investment"]
+CATEGORIES = ["food", "games", "transport", None]
+
+
+def random_transactions(rng, count):
+    transactions = []
+    for _ in range(count):
+        if rng.random() < 0.05:
+            date = "не дата"
+        else:
+            date = f"{rng.randint(2022, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:00"
+        transactions.append({
+            "type": rng.choice(TYPES),
+            "amount": round(rng.uniform(1, 5000), 2),
+            "category": rng.choice(CATEGORIES),
+            "description": "тест",
+            "date": date
+        })
+    return transactions
+
+
+def brute_force(ledger):
+    categories = {}
+    totals = {}
+    months = {}
+    for t in ledger:
+        if t.month_key is None:
+            continue
+        key = (t.month_key, t.type)
+        categories.setdefault(key, {})
+        categories[key][t.category] = categories[key].get(t.category, 0) + t.amount
+        totals[key] = totals.get(key, 0) + t.amount
+        months[t.month_key] = months.get(t.month_key, 0) + 1
+    return categories, totals, months
+
+
+def test_incremental_index_matches_full_rebuild(make_app):
+    rng = random.Random(8)
+    app = make_app()
+    aggregates = app.get_aggregates()
+    # Пачки приходят в произвольном порядке дат, в том числе задним числом
+    for _ in range(10):
+        app.data["transactions"].extend(random_transactions(rng, rng.randint(1, 60)))
+        assert app.get_aggregates() is aggregates
+
+    ledger = app.get_ledger()
+    categories, totals, months = brute_force(ledger)
+    assert aggregates.categories == categories
+    assert aggregates.totals == totals
+    assert aggregates.month_versions == months
+
+    rebuilt = main.AggregateIndex(ledger)
+    assert rebuilt.categories == aggregates.categories
+    assert rebuilt.totals == aggregates.totals
+
+
+def test_totals_are_category_sums():
+    rng = random.Random(81)
+    index = main.AggregateIndex(main.Transaction(t) for t in random_transactions(rng, 300))
+    for key, amounts in index.categories.items():
+        assert index.totals[key] == sum(amounts.values())
+
+
+def test_month_queries_in_rubles():
+    ledger = [
+        main.Transaction({"type": "expense", "amount": 10.5, "category": "food", "date": "2024-03-01"}),
+        main.Transaction({"type": "expense", "amount": 4.5, "category": "food", "date": "2024-03-31 23:59"}),
+        main.Transaction({"type": "expense", "amount": 7, "category": "games", "date": "2024-03-15"}),
+        main.Transaction({"type": "income", "amount": 100, "category": "food", "date": "2024-03-15"}),
+        main.Transaction({"type": "expense", "amount": 1, "category": "food", "date": "2024-04-01"}),
+    ]
+    index = main.AggregateIndex(ledger)
+    assert index.total("2024-03", "expense") == 22
+    assert index.category_totals("2024-03", "expense") == {"food": 15, "games": 7}
+    assert index.total("2024-05", "expense") == 0
+    assert index.category_totals("2024-05", "expense") == {}
+
+
+def test_replaced_list_rebuilds_index(make_app, make_transaction):
+    app = make_app()
+    app.add_transaction(make_transaction(10, "2024-01-01"))
+    app.add_transaction(make_transaction(20, "2024-01-02"))
+    before = app.get_aggregates()
+
+    app.data["transactions"] = app.data["transactions"][1:]
+    after = app.get_aggregates()
+    assert after is not before
+    assert after.total("2024-01", "expense") == 20
+
+
+def test_period_category_totals_match_brute_force(make_app):
+    rng = random.Random(82)
+    app = make_app()
+    app.data["transactions"].extend(random_transactions(rng, 400))
+    app.save_data()
+
+    expected = {}
+    for t in app.get_ledger():
+        if t.type == "expense" and t.timestamp is not None and "2023-02-10" <= t.source["date"][:10] < "2023-09-01":
+            expected[t.category] = expected.get(t.category, 0) + t.amount
+    totals = app.category_totals("expense", "2023-02-10", "2023-09-01")
+    assert totals == pytest.approx({category: amount / main.KOPECKS for category, amount in expected.items()})
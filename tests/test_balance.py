@@ -0,0 +1,78 @@
+import random
+
+import pytest
+
+main = pytest.importorskip("main")
+
+TYPES = ["income", "expense", "goal_investment", "transfer"]
+
+
+def random_transactions(rng, count):
+    return [{
+        "type": rng.choice(TYPES),
+        "amount": round(rng.uniform(1, 10000), 2),
+        "category": "food",
+        "description": "тест",
+        "date": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:00"
+    } for _ in range(count)]
+
+
+def flow(t):
+    return main.BALANCE_SIGNS.get(t.type, 0) * t.amount
+
+
+def assert_prefix(index):
+    assert index.prefix[0] == 0
+    assert len(index.prefix) == len(index.transactions) + 1
+    for i, t in enumerate(index.transactions):
+        assert index.prefix[i + 1] - index.prefix[i] == flow(t)
+
+
+def test_prefix_sums_survive_backdated_inserts():
+    rng = random.Random(10)
+    ledger = [main.Transaction(t) for t in random_transactions(rng, 200)]
+    index = main.DateIndex(ledger[:100])
+    assert_prefix(index)
+    for t in ledger[100:]:
+        index.add(t)
+    assert_prefix(index)
+    assert index.total_flow() == sum(flow(t) for t in ledger)
+
+
+def test_unknown_type_does_not_move_balance():
+    index = main.DateIndex([main.Transaction({"type": "transfer", "amount": 500, "date": "2024-01-01"})])
+    assert index.total_flow() == 0
+
+
+def test_balance_at_and_net_flow_match_brute_force(make_app):
+    rng = random.Random(101)
+    app = make_app()
+    app.data["current_money"] = 123456.78
+    app.data["transactions"].extend(random_transactions(rng, 300))
+    app.save_data()
+    ledger = app.get_ledger()
+
+    for _ in range(40):
+        moment = f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:{rng.choice([0, 30]):02d}"
+        timestamp = main.transaction_timestamp(moment)
+        # Баланс до moment: текущий минус все движения в момент moment и позже
+        later = sum(flow(t) for t in ledger if t.timestamp >= timestamp)
+        assert app.balance_at(moment) == pytest.approx(123456.78 - later / main.KOPECKS)
+
+    for _ in range(40):
+        start, end = sorted([f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}" for _ in range(2)])
+        low, high = main.transaction_timestamp(start), main.transaction_timestamp(end)
+        expected = sum(flow(t) for t in ledger if low <= t.timestamp < high)
+        assert app.net_flow(start, end) == pytest.approx(expected / main.KOPECKS)
+
+
+def test_balance_follows_new_transactions(make_app, make_transaction):
+    app = make_app()
+    app.data["current_money"] = 1000
+    app.add_transaction(make_transaction(300, "2024-06-10 12:00"))
+    assert app.balance_at("2024-06-10 12:00") == 1300
+    assert app.balance_at("2024-06-10 12:30") == 1000
+
+    app.add_transaction(make_transaction(200, "2024-06-01", transaction_type="income"))
+    assert app.balance_at("2024-06-01") == 1100
+    assert app.net_flow("2024-06-01", "2024-07-01") == -100
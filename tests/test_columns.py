@@ -0,0 +1,85 @@
+import random
+
+import pytest
+
+main = pytest.importorskip("main")
+pytest.importorskip("numpy")
+
+TYPES = ["income", "expense", "goal_investment", "transfer"]
+
+
+def random_transactions(rng, count):
+    transactions = []
+    for _ in range(count):
+        date = f"{rng.randint(2023, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:{rng.choice([0, 15]):02d}"
+        transactions.append({
+            "type": rng.choice(TYPES),
+            "amount": round(rng.uniform(0, 9000), 2),
+            "category": rng.choice(["food", "games", None]),
+            "description": "тест",
+            "date": rng.choice([date, date, date, date[:10], "не дата"])
+        })
+    return transactions
+
+
+def assert_same_indexes(app, transactions):
+    ledger = [main.Transaction(t) for t in transactions]
+    assert [t.source for t in app.ledger] == transactions
+    for restored, parsed in zip(app.ledger, ledger):
+        for name in ("type", "category", "amount", "timestamp", "month_key", "year", "month", "weekday"):
+            assert getattr(restored, name) == getattr(parsed, name), name
+
+    aggregates = main.AggregateIndex(ledger)
+    assert app.aggregates.categories == aggregates.categories
+    assert app.aggregates.totals == aggregates.totals
+    assert app.aggregates.month_versions == aggregates.month_versions
+
+    dates = main.DateIndex(ledger)
+    assert [t.source for t in app.date_index.transactions] == [t.source for t in dates.transactions]
+    assert list(app.date_index.timestamps) == dates.timestamps
+    assert list(app.date_index.prefix) == dates.prefix
+
+
+def test_startup_from_columns_matches_full_parse(make_app, monkeypatch):
+    rng = random.Random(4)
+    app = make_app()
+    app.data["transactions"].extend(random_transactions(rng, 500))
+    app.compact()
+    transactions = app.data["transactions"]
+
+    restores = []
+    restore = main.ColumnarTransactionStore.restore
+    monkeypatch.setattr(main.ColumnarTransactionStore, "restore",
+                        lambda self, source: restores.append(len(self)) or restore(self, source))
+    restored = make_app()
+    assert restores == [500]
+    assert restored.data["transactions"] == transactions
+    assert_same_indexes(restored, transactions)
+
+
+def test_journal_tail_after_columns_is_parsed(make_app):
+    rng = random.Random(41)
+    app = make_app()
+    app.data["transactions"].extend(random_transactions(rng, 200))
+    app.compact()
+    # Записи после снимка (и колоночной копии) приходят из журнала
+    for t in random_transactions(rng, 30):
+        app.add_transaction(t)
+
+    restored = make_app()
+    assert_same_indexes(restored, restored.data["transactions"])
+    assert len(restored.ledger) == 230
+
+
+def test_stale_columns_are_ignored(make_app, make_transaction):
+    app = make_app()
+    app.add_transaction(make_transaction(1, "2024-01-01"))
+    app.add_transaction(make_transaction(2, "2024-01-02"))
+    app.compact()
+    # Список заменили - копия больше не совпадает с началом транзакций
+    app.data["transactions"] = [make_transaction(3, "2024-01-03")]
+    app.save_data()
+
+    restored = make_app()
+    assert [t.amount for t in restored.ledger] == [300]
+    assert_same_indexes(restored, restored.data["transactions"])
@@ -0,0 +1,79 @@
+import random
+
+import pytest
+
+main = pytest.importorskip("main")
+
+
+def dated(rng, count, year=2024):
+    ledger = []
+    for _ in range(count):
+        date = f"{year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:{rng.choice([0, 30]):02d}"
+        ledger.append(main.Transaction({"type": "expense", "amount": rng.randint(1, 100), "date": date}))
+    return ledger
+
+
+def assert_sorted(index):
+    assert index.timestamps == sorted(index.timestamps)
+    assert index.timestamps == [t.timestamp for t in index.transactions]
+
+
+@pytest.mark.parametrize("batch", [1, 5, 40])
+def test_backdated_additions_keep_order(batch):
+    # Пачки до 16 записей задним числом вставляются по одной, большие - пересборкой индекса
+    rng = random.Random(9 + batch)
+    index = main.DateIndex(dated(rng, 50))
+    everything = list(index.transactions)
+    for _ in range(6):
+        added = dated(rng, batch)
+        index.extend(added)
+        everything += added
+        assert_sorted(index)
+    assert sorted(map(id, index.transactions)) == sorted(map(id, everything))
+
+
+def test_undated_transactions_are_skipped():
+    ledger = [
+        main.Transaction({"type": "expense", "amount": 1, "date": "2024-01-02"}),
+        main.Transaction({"type": "expense", "amount": 2, "date": "вчера"}),
+    ]
+    index = main.DateIndex(ledger)
+    index.add(main.Transaction({"type": "expense", "amount": 3, "date": ""}))
+    assert [t.amount for t in index.transactions] == [100]
+
+
+def test_equal_times_keep_insertion_order():
+    first = main.Transaction({"type": "expense", "amount": 1, "date": "2024-05-05 10:00"})
+    second = main.Transaction({"type": "expense", "amount": 2, "date": "2024-05-05 10:00"})
+    later = main.Transaction({"type": "expense", "amount": 3, "date": "2024-06-01"})
+    index = main.DateIndex([first, later])
+    index.add(second)
+    assert index.transactions == [first, second, later]
+
+
+def test_between_is_half_open_range():
+    rng = random.Random(91)
+    index = main.DateIndex(dated(rng, 500))
+    for _ in range(50):
+        start, end = sorted(rng.sample(range(index.timestamps[0] - 86400, index.timestamps[-1] + 86400), 2))
+        expected = [t for t in index.transactions if start <= t.timestamp < end]
+        assert index.between(start, end) == expected
+
+
+def test_latest():
+    rng = random.Random(92)
+    index = main.DateIndex(dated(rng, 30))
+    assert index.latest(5) == index.transactions[-5:]
+    assert index.latest(0) == []
+    assert index.latest(100) == index.transactions
+
+
+def test_transactions_between_dates(make_app, make_transaction):
+    app = make_app()
+    for date in ["2024-03-10 12:00", "2024-01-31 23:59", "2024-02-01", "2024-02-29 18:00", "2024-03-01"]:
+        app.data["transactions"].append(make_transaction(1, date))
+    app.save_data()
+
+    february = app.transactions_between("2024-02-01", "2024-03-01")
+    assert [t.source["date"] for t in february] == ["2024-02-01", "2024-02-29 18:00"]
+    assert [t.source["date"] for t in app.latest_transactions(2)] == ["2024-03-01", "2024-03-10 12:00"]
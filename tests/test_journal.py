@@ -0,0 +1,95 @@
+import json
+
+import pytest
+
+# main.py импортирует flet при загрузке модуля: без него тесты пропускаются
+main = pytest.importorskip("main")
+
+
+def read_journal(path="finance_data.journal"):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_new_transactions_are_appended_to_journal(make_app, make_transaction):
+    app = make_app()
+    app.add_transaction(make_transaction(100, "2024-01-05 10:00"))
+    with open("finance_data.json", "rb") as f:
+        snapshot = f.read()
+
+    app.add_transaction(make_transaction(200, "2024-01-06 10:00"))
+    app.add_transaction(make_transaction(300, "2024-01-07 10:00"))
+
+    # Снимок не переписывается, новые транзакции идут в журнал по одной записи
+    with open("finance_data.json", "rb") as f:
+        assert f.read() == snapshot
+    records = read_journal()
+    assert [record["op"] for record in records] == ["append", "append"]
+    assert [record["value"]["amount"] for record in records] == [200, 300]
+    assert [record["seq"] for record in records] == [records[0]["seq"], records[0]["seq"] + 1]
+
+    reloaded = make_app()
+    assert reloaded.data["transactions"] == app.data["transactions"]
+
+
+def test_changed_and_deleted_keys_are_journaled(make_app):
+    app = make_app()
+    app.save_data()
+    app.data["salary"] = 50000
+    app.data["extra"] = {"a": 1}
+    app.save_data()
+    del app.data["extra"]
+    app.save_data()
+
+    ops = [(record["op"], record["key"]) for record in read_journal()]
+    assert ops == [("set", "salary"), ("set", "extra"), ("delete", "extra")]
+
+    reloaded = make_app()
+    assert reloaded.data["salary"] == 50000
+    assert "extra" not in reloaded.data
+
+
+def test_unchanged_data_writes_nothing(make_app):
+    app = make_app()
+    app.save_data()
+    app.save_data()
+    assert read_journal() == []
+
+
+def test_journal_is_compacted_after_threshold(make_app, make_transaction, monkeypatch):
+    monkeypatch.setattr(main, "JOURNAL_COMPACT_THRESHOLD", 3)
+    app = make_app()
+    for day in range(1, 11):
+        app.add_transaction(make_transaction(day, f"2024-02-{day:02d}"))
+        assert len(read_journal()) <= 3
+
+    reloaded = make_app()
+    assert [t["amount"] for t in reloaded.data["transactions"]] == list(range(1, 11))
+
+
+def test_replaced_transaction_list_is_compacted(make_app, make_transaction):
+    app = make_app()
+    app.add_transaction(make_transaction(100, "2024-01-05"))
+    app.add_transaction(make_transaction(200, "2024-01-06"))
+    # Список заменили целиком (удаление) - журналом это не выразить, пишется снимок
+    app.data["transactions"] = app.data["transactions"][1:]
+    app.save_data()
+
+    assert read_journal() == []
+    assert [t["amount"] for t in make_app().data["transactions"]] == [200]
+
+
+def test_torn_last_journal_line_is_ignored(make_app, make_transaction):
+    app = make_app()
+    app.add_transaction(make_transaction(100, "2024-01-05"))
+    app.add_transaction(make_transaction(200, "2024-01-06"))
+    with open("finance_data.journal", "a", encoding="utf-8") as f:
+        f.write('{"op": "append", "key": "transactions", "val')
+
+    reloaded = make_app()
+    assert [t["amount"] for t in reloaded.data["transactions"]] == [100, 200]
+    # Поврежденный журнал сворачивается при загрузке
+    assert read_journal() == []
+
+    reloaded.add_transaction(make_transaction(300, "2024-01-07"))
+    assert [t["amount"] for t in make_app().data["transactions"]] == [100, 200, 300]
@@ -0,0 +1,91 @@
+import json
+
+import pytest
+
+main = pytest.importorskip("main")
+
+
+def write_legacy(data):
+    with open("finance_data.json", "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+
+
+def read_snapshot_body():
+    with open("finance_data.json", "rb") as f:
+        f.readline()
+        return json.loads(f.read())
+
+
+LEGACY_V0 = {
+    "salary": 60000,
+    "current_money": 15000,
+    "transactions": [
+        {"type": "income", "amount": 60000, "description": "Зарплата", "date": "2023-05-08 09:00"}
+    ],
+    "goals": [],
+    "monthly_budget": {}
+}
+
+
+def test_v0_data_is_migrated_and_saved(make_app):
+    write_legacy(LEGACY_V0)
+
+    app = make_app()
+    assert app.data["schema_version"] == main.SCHEMA_VERSION
+    for key, value in main.default_data().items():
+        assert key in app.data, key
+    # Существующие значения миграции не трогают
+    assert app.data["salary"] == 60000
+    assert app.data["transactions"] == LEGACY_V0["transactions"]
+
+    # Результат миграции сразу записан снимком
+    assert read_snapshot_body()["schema_version"] == main.SCHEMA_VERSION
+
+
+def test_only_missing_steps_run(make_app):
+    data = dict(LEGACY_V0, schema_version=1, rent=7000, salary_dates=[5, 20])
+    write_legacy(data)
+
+    app = make_app()
+    assert app.data["settings"] == main.default_settings()
+    assert app.data["rent"] == 7000
+    assert app.data["salary_dates"] == [5, 20]
+
+
+def test_current_data_is_not_migrated(make_app):
+    app = make_app()
+    before = json.dumps(app.data, sort_keys=True)
+    assert app.migrate() is False
+    assert json.dumps(app.data, sort_keys=True) == before
+
+
+def test_new_step_runs_once(make_app, monkeypatch):
+    make_app().save_data()
+
+    calls = []
+
+    def migrate_to_next(data):
+        calls.append(data["schema_version"])
+        data["currency"] = "RUB"
+
+    next_version = main.SCHEMA_VERSION + 1
+    monkeypatch.setattr(main, "SCHEMA_MIGRATIONS", main.SCHEMA_MIGRATIONS + [(next_version, migrate_to_next)])
+    monkeypatch.setattr(main, "SCHEMA_VERSION", next_version)
+
+    app = make_app()
+    assert calls == [next_version - 1]
+    assert app.data["currency"] == "RUB"
+    assert app.data["schema_version"] == next_version
+
+    make_app()
+    assert calls == [next_version - 1]
+
+
+def test_sqlite_storage_receives_migrated_data(make_app):
+    write_legacy(LEGACY_V0)
+    make_app(storage="sqlite")
+
+    app = make_app(storage="sqlite")
+    assert app.data["schema_version"] == main.SCHEMA_VERSION
+    assert app.data["settings"] == main.default_settings()
+    assert app.data["transactions"] == LEGACY_V0["transactions"]
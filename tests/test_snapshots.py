@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+
+import pytest
+
+main = pytest.importorskip("main")
+
+
+def corrupt(path):
+    with open(path, "r+b") as f:
+        f.seek(-10, os.SEEK_END)
+        f.write(b"##########")
+
+
+def fill(app, make_transaction, count):
+    for day in range(1, count + 1):
+        app.add_transaction(make_transaction(day, f"2024-03-{day:02d}"))
+
+
+def test_snapshot_header_checksums_body(make_app, make_transaction):
+    app = make_app()
+    app.add_transaction(make_transaction(100, "2024-01-05"))
+    app.compact()
+
+    with open("finance_data.json", "rb") as f:
+        header = json.loads(f.readline())
+        body = f.read()
+    assert header["sha256"] == hashlib.sha256(body).hexdigest()
+    assert header["journal_seq"] == app._journal_seq
+    assert json.loads(body)["transactions"] == app.data["transactions"]
+
+
+def test_old_snapshots_and_journal_segments_are_kept(make_app, make_transaction, monkeypatch):
+    monkeypatch.setattr(main, "JOURNAL_COMPACT_THRESHOLD", 3)
+    fill(make_app(), make_transaction, 20)
+
+    for index in range(1, main.SNAPSHOT_KEEP + 1):
+        assert os.path.exists(f"finance_data.json.{index}")
+        assert os.path.exists(f"finance_data.journal.{index}")
+    assert not os.path.exists(f"finance_data.json.{main.SNAPSHOT_KEEP + 1}")
+    assert not os.path.exists(f"finance_data.journal.{main.SNAPSHOT_KEEP + 1}")
+
+
+def test_intact_snapshot_loads_without_notice(make_app, make_transaction):
+    app = make_app()
+    app.add_transaction(make_transaction(100, "2024-01-05"))
+    assert make_app().recovery_notice is None
+
+
+@pytest.mark.parametrize("damaged", [1, 2])
+def test_fallback_replays_journal_segments(make_app, make_transaction, monkeypatch, damaged):
+    monkeypatch.setattr(main, "JOURNAL_COMPACT_THRESHOLD", 3)
+    app = make_app()
+    fill(app, make_transaction, 20)
+    expected = list(app.data["transactions"])
+
+    corrupt("finance_data.json")
+    if damaged == 2:
+        corrupt("finance_data.json.1")
+
+    # Откат к старому снимку не теряет правок: свернутые части журнала проигрываются заново
+    recovered = make_app()
+    assert recovered.data["transactions"] == expected
+    assert recovered.recovery_notice is not None
+    assert "не удалось" not in recovered.recovery_notice
+
+    # Восстановленные данные сразу записываются новым целым снимком
+    assert make_app().recovery_notice is None
+
+
+def test_missing_segment_stops_replay_at_gap(make_app, make_transaction, monkeypatch):
+    monkeypatch.setattr(main, "JOURNAL_COMPACT_THRESHOLD", 3)
+    app = make_app()
+    fill(app, make_transaction, 20)
+    last_seq = app._journal_seq
+
+    for index in range(main.SNAPSHOT_KEEP):
+        corrupt(f"finance_data.json{'.' + str(index) if index else ''}")
+    os.remove(f"finance_data.journal.{main.SNAPSHOT_KEEP - 1}")
+
+    recovered = make_app()
+    amounts = [t["amount"] for t in recovered.data["transactions"]]
+    # Применен только непрерывный префикс истории
+    assert amounts == list(range(1, len(amounts) + 1))
+    assert len(amounts) < 20
+    assert "не удалось" in recovered.recovery_notice
+    # Номера записей из уцелевших частей журнала больше не выдаются
+    assert recovered._journal_seq >= last_seq
+
+    recovered.add_transaction(make_transaction(99, "2024-04-01"))
+    assert [t["amount"] for t in make_app().data["transactions"]] == amounts + [99]
+
+
+def test_unjournaled_changes_leave_gap_for_older_snapshots(make_app, make_transaction):
+    app = make_app()
+    app.add_transaction(make_transaction(1, "2024-03-01"))
+    app.compact()
+    # Замена списка пишется сразу снимком, без записей журнала
+    app.data["transactions"] = []
+    app.save_data()
+    app.add_transaction(make_transaction(2, "2024-03-02"))
+
+    corrupt("finance_data.json")
+    recovered = make_app()
+    # Запись после замены нельзя докатить до старого снимка мимо самой замены
+    assert [t["amount"] for t in recovered.data["transactions"]] == [1]
+    assert "не удалось" in recovered.recovery_notice
+
+
+def test_legacy_plain_json_is_loaded(make_app):
+    data = main.default_data()
+    data["salary"] = 12345
+    with open("finance_data.json", "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+    app = make_app()
+    assert app.data["salary"] == 12345
+    assert app.recovery_notice is None
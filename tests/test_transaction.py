@@ -0,0 +1,66 @@
+import calendar
+from datetime import datetime
+
+import pytest
+
+main = pytest.importorskip("main")
+
+
+def test_date_with_time_is_parsed_once():
+    t = main.Transaction({"type": "expense", "amount": 12.34, "category": "food", "date": "2024-03-05 14:30"})
+    assert t.timestamp == calendar.timegm(datetime(2024, 3, 5, 14, 30).timetuple())
+    assert (t.month_key, t.year, t.month) == ("2024-03", 2024, 3)
+    assert main.WEEKDAY_NAMES[t.weekday] == "Tuesday"
+    assert t.amount == 1234
+    assert t.type == "expense" and t.category == "food"
+
+
+def test_date_without_time():
+    t = main.Transaction({"type": "income", "amount": 100, "date": "2024-12-31"})
+    assert t.timestamp == calendar.timegm(datetime(2024, 12, 31).timetuple())
+    assert t.month_key == "2024-12"
+    # Категория по умолчанию, как у старых записей без поля category
+    assert t.category == "Прочее"
+
+
+@pytest.mark.parametrize("date", ["", "31.12.2024", "2024-13-01", "2024-01-05 10:00:00", None])
+def test_unparsed_date_belongs_to_no_period(date):
+    t = main.Transaction({"type": "expense", "amount": 5, "date": date})
+    assert t.timestamp is None
+    assert t.month_key is None and t.year is None and t.month is None and t.weekday is None
+
+
+def test_transaction_has_slots_only():
+    t = main.Transaction({"type": "expense", "amount": 1, "date": "2024-01-01"})
+    assert not hasattr(t, "__dict__")
+    with pytest.raises(AttributeError):
+        t.note = "x"
+
+
+def test_source_dict_is_kept():
+    source = {"type": "expense", "amount": 1, "date": "2024-01-01", "description": "кофе"}
+    assert main.Transaction(source).source is source
+
+
+def test_restore_matches_parsed_transaction():
+    source = {"type": "expense", "amount": 99.99, "category": "games", "date": "2024-02-29 23:59"}
+    parsed = main.Transaction(source)
+    restored = main.Transaction.restore(
+        source, parsed.type, parsed.category, parsed.amount, parsed.timestamp,
+        parsed.month_key, parsed.year, parsed.month, parsed.weekday
+    )
+    for name in main.Transaction.__slots__:
+        assert getattr(restored, name) == getattr(parsed, name), name
+
+
+def test_ledger_follows_transaction_list(make_app, make_transaction):
+    app = make_app()
+    app.add_transaction(make_transaction(10, "2024-01-01"))
+    ledger = app.get_ledger()
+    app.add_transaction(make_transaction(20, "2024-01-02"))
+
+    # Добавление дописывает ledger на месте, замена списка пересобирает его
+    assert app.get_ledger() is ledger
+    assert [t.source for t in ledger] == app.data["transactions"]
+    app.data["transactions"] = app.data["transactions"][:1]
+    assert [t.amount for t in app.get_ledger()] == [1000]